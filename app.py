@@ -5,33 +5,67 @@ Works both locally (reads .env) and on HuggingFace Spaces (reads secrets).
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import logging
 import os
 import random
+import threading
+import time
 import warnings
+from collections.abc import AsyncIterator, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 
 import gradio as gr
+import numpy as np
 from dotenv import load_dotenv
-from huggingface_hub import InferenceClient
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from huggingface_hub import AsyncInferenceClient, InferenceClient
+from langchain_core.documents import Document
+from sentence_transformers import SentenceTransformer
 
+from cache import PersistentAnswerCache, SemanticCache, index_fingerprint
 from config import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_TTL,
     APP_DESCRIPTION,
     APP_TITLE,
+    CONCURRENCY_LIMIT,
+    CONFIDENCE_GATE_ENABLED,
+    CONFIDENCE_THRESHOLD,
+    CONTEXT_TOKEN_BUDGET,
     CUSTOM_CSS,
     EMBEDDING_MODEL,
     EXAMPLE_QUESTIONS,
     FAISS_INDEX_DIR,
     GANDALF_QUOTES,
     GANDALF_THEME,
+    HNSW_EF_SEARCH,
+    IVF_NPROBE,
     LLM_MAX_NEW_TOKENS,
     LLM_MODEL,
+    LLM_STREAM,
     LLM_TEMPERATURE,
+    RERANK_FACTOR,
+    RETRIEVAL_K,
+    RETRIEVAL_WORKERS,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_MAX_SIZE,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL,
     SYSTEM_MESSAGE,
     USER_TEMPLATE,
 )
+from context import assemble_context, load_token_counter
+from index_store import read_shards
+from retrieval import NativeRetriever, confidence, load_retriever
 
 warnings.filterwarnings("ignore", category=FutureWarning)
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+log = logging.getLogger(__name__)
 
 # ── Environment ───────────────────────────────────────────────────────────
 load_dotenv()  # no-op on HF Spaces (no .env file present)
@@ -40,64 +74,342 @@ hf_token: str | None = os.getenv("HUGGINGFACEHUB_API_TOKEN")
 if not hf_token:
     raise ValueError("Missing HUGGINGFACEHUB_API_TOKEN environment variable.")
 
-# ── Vectorstore ───────────────────────────────────────────────────────────
-embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-db = FAISS.load_local(
-    FAISS_INDEX_DIR, embedding_model, allow_dangerous_deserialization=True
+# ── Vectorstore (loaded in the background) ───────────────────────────────
+
+@dataclass
+class Lore:
+    """Everything retrieval needs, built once by the background loader."""
+
+    retriever: NativeRetriever
+    count_tokens: Callable[[str], int]  # LLM tokenizer, for the context budget
+    cache_namespace: str  # semantic cache key: model | temperature | index
+    store_namespace: str  # persistent cache key: the above + system prompt
+
+
+_lore: Lore | None = None
+_lore_error: BaseException | None = None
+_lore_ready = threading.Event()
+startup_timings: dict[str, float] = {}
+
+
+@contextmanager
+def _phase(name: str) -> Iterator[None]:
+    """Record how long one startup phase takes."""
+    start = time.perf_counter()
+    yield
+    startup_timings[name] = time.perf_counter() - start
+    log.info("Startup: %s took %.2fs", name, startup_timings[name])
+
+
+def _load_lore() -> None:
+    """Load the embedding model, FAISS index and LLM tokenizer, then warm up."""
+    global _lore, _lore_error
+    try:
+        with _phase("embedding_model"):
+            embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+        with _phase("faiss_index"):
+            # Queries are embedded with the settings the index was built with
+            retriever = load_retriever(
+                FAISS_INDEX_DIR,
+                ef_search=HNSW_EF_SEARCH,
+                nprobe=IVF_NPROBE,
+                rerank_factor=RERANK_FACTOR,
+                model=embedding_model,
+            )
+        with _phase("tokenizer"):
+            count_tokens = load_token_counter(LLM_MODEL)
+        with _phase("index_fingerprint"):
+            cache_namespace = (
+                f"{LLM_MODEL}|{LLM_TEMPERATURE}|{index_fingerprint(FAISS_INDEX_DIR)}"
+            )
+            prompt_hash = hashlib.sha256(SYSTEM_MESSAGE.encode("utf-8")).hexdigest()[:16]
+        with _phase("warmup"):
+            retriever.invoke("Who is Gandalf?", k=RETRIEVAL_K)
+        _lore = Lore(
+            retriever=retriever,
+            count_tokens=count_tokens,
+            cache_namespace=cache_namespace,
+            store_namespace=f"{cache_namespace}|{prompt_hash}",
+        )
+        log.info("Lore ready in %.2fs", sum(startup_timings.values()))
+    except BaseException as exc:  # surfaced to every waiting request
+        _lore_error = exc
+        log.exception("Failed to load the lore index")
+    finally:
+        _lore_ready.set()
+
+
+def get_lore(timeout: float | None = None) -> Lore:
+    """Block until the background load finishes and return the loaded lore."""
+    if not _lore_ready.wait(timeout):
+        raise TimeoutError("The lore is still loading.")
+    if _lore is None:
+        raise RuntimeError("The lore index failed to load.") from _lore_error
+    return _lore
+
+
+def readiness() -> dict[str, object]:
+    """Readiness state, per-phase startup timings (seconds) and cache counters."""
+    return {
+        "ready": _lore is not None,
+        "error": repr(_lore_error) if _lore_error else None,
+        "timings": dict(startup_timings),
+        "semantic_cache": answer_cache.stats() if SEMANTIC_CACHE_ENABLED else None,
+    }
+
+
+threading.Thread(target=_load_lore, name="lore-loader", daemon=True).start()
+
+# ── Answer cache ──────────────────────────────────────────────────────────
+answer_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_size=SEMANTIC_CACHE_MAX_SIZE,
+    ttl=SEMANTIC_CACHE_TTL,
+)
+
+# Optional exact-match cache shared by all workers; the prompt is part of
+# its key because entries outlive the process.
+answer_store = (
+    PersistentAnswerCache(ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES)
+    if ANSWER_CACHE_ENABLED
+    else None
 )
-retriever = db.as_retriever(search_kwargs={"k": 6})
 
 # ── LLM ───────────────────────────────────────────────────────────────────
 client = InferenceClient(model=LLM_MODEL, token=hf_token)
+async_client = AsyncInferenceClient(model=LLM_MODEL, token=hf_token)
+
+# Embedding + FAISS search is CPU-bound; a bounded pool keeps it off the
+# event loop without spawning a thread per request.
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval"
+)
 
 
 # ── Chat function ─────────────────────────────────────────────────────────
 
-def ask_gandalf(question: str) -> str:
-    """Retrieve relevant lore and generate a Gandalf-style answer."""
-    # Retrieve relevant documents
-    docs = retriever.invoke(question)
-    context = "\n\n".join(doc.page_content for doc in docs)
+def _scoped(namespace: str, books: list[str] | None) -> str:
+    """Cache namespace of a question asked about ``books`` only."""
+    return f"{namespace}|books={','.join(sorted(books))}" if books else namespace
+
+
+def _lookup_or_retrieve(
+    question: str,
+    books: list[str] | None = None,
+) -> tuple[np.ndarray | None, str | None, list[Document]]:
+    """Serve a cached answer or embed the question once and retrieve lore.
 
-    # Build chat messages
-    messages = [
+    The exact-match store is checked before embedding; the semantic cache
+    reuses the retrieval embedding. ``books`` limits the search to those
+    books' shards (default: all). With ``ADAPTIVE_K`` the number of chunks
+    follows their scores (see :func:`retrieval.adaptive_k`), otherwise it
+    is ``RETRIEVAL_K``. With ``CONFIDENCE_GATE_ENABLED``, when no retrieved
+    chunk reaches ``CONFIDENCE_THRESHOLD`` the answer is a fallback quote
+    and the LLM is never called. Returns ``(embedding, ready_answer, docs)``; ``docs`` is
+    empty when the answer is ready.
+    """
+    lore = get_lore()  # requests that arrive during startup wait here
+    if answer_store is not None:
+        cached = answer_store.get(question, _scoped(lore.store_namespace, books))
+        if cached is not None:
+            return None, cached, []
+
+    embedding = lore.retriever.embed_query(question)
+    if SEMANTIC_CACHE_ENABLED:
+        cached = answer_cache.lookup(_scoped(lore.cache_namespace, books), embedding)
+        if cached is not None:
+            return embedding, cached, []
+    results = lore.retriever.retrieve(embedding, question=question, books=books)
+    if CONFIDENCE_GATE_ENABLED:
+        best = confidence(results)
+        if best < CONFIDENCE_THRESHOLD:
+            log.info(
+                "Confidence gate: best chunk similarity %.3f < %.3f, skipping the LLM",
+                best,
+                CONFIDENCE_THRESHOLD,
+            )
+            return embedding, random.choice(GANDALF_QUOTES), []
+        log.debug("Confidence gate: best chunk similarity %.3f", best)
+    log.debug("Retrieved %d chunks", len(results))
+    return embedding, None, [doc for doc, _ in results]
+
+
+def _build_messages(question: str, docs: list[Document]) -> list[dict[str, str]]:
+    """Assemble the system + user chat messages for the retrieved lore.
+
+    Overlapping and consecutive chunks are merged and the context is capped
+    at ``CONTEXT_TOKEN_BUDGET`` LLM tokens (see :func:`context.assemble_context`).
+    """
+    context = assemble_context(docs, get_lore().count_tokens, CONTEXT_TOKEN_BUDGET)
+    return [
         {"role": "system", "content": SYSTEM_MESSAGE},
         {"role": "user", "content": USER_TEMPLATE.format(context=context, question=question)},
     ]
 
-    # Generate answer via chat completion
-    response = client.chat_completion(
+
+def _format_reference(docs: list[Document]) -> str:
+    """Build the source citation from the first retrieved chunk."""
+    if not docs:
+        return "📖 Source: Unknown"
+
+    meta = docs[0].metadata
+    book = meta.get("book_name", "Unknown book")
+    chapter_num = meta.get("chapter_number", "")
+    chapter_name = meta.get("chapter_name", "Unknown chapter")
+    parts = [book]
+    if chapter_num:
+        parts.append(chapter_num)
+    if chapter_name and chapter_name != "Unknown":
+        parts.append(chapter_name)
+    return f"📖 Source: {', '.join(parts)}"
+
+
+def _finalize(answer: str, reference: str) -> tuple[str, bool]:
+    """Apply the "I don't know" fallback and append the citation.
+
+    Returns:
+        The final answer, and whether a fallback quote replaced the LLM's.
+    """
+    fallback = "i don't know" in answer.lower()
+    if fallback:
+        answer = random.choice(GANDALF_QUOTES)
+    return f"{answer}\n\n{reference}", fallback
+
+
+def _cache_answer(
+    question: str,
+    embedding: np.ndarray,
+    final: str,
+    books: list[str] | None = None,
+    fallback: bool = False,
+) -> str:
+    """Remember a finished answer for identical and similar future questions.
+
+    A ``fallback`` quote is not cached at all, so asking again (or
+    rephrasing) gets a fresh attempt at a real answer.
+    """
+    if fallback:
+        return final
+    lore = get_lore()
+    if SEMANTIC_CACHE_ENABLED:
+        answer_cache.store(_scoped(lore.cache_namespace, books), embedding, final)
+    if answer_store is not None:
+        answer_store.put(question, _scoped(lore.store_namespace, books), final)
+    return final
+
+
+def ask_gandalf(question: str, books: list[str] | None = None) -> Iterator[str]:
+    """Retrieve relevant lore and stream a Gandalf-style answer.
+
+    Yields the partial Markdown answer as tokens arrive, then the final
+    answer with the source citation appended. ``books`` restricts the
+    search to those books (empty or ``None``: all of them).
+    """
+    # Retrieve relevant documents (or a cached / gated answer)
+    embedding, ready, docs = _lookup_or_retrieve(question, books)
+    if ready is not None:
+        yield ready
+        return
+    messages = _build_messages(question, docs)
+    reference = _format_reference(docs)
+
+    if not LLM_STREAM:
+        response = client.chat_completion(
+            messages=messages,
+            max_tokens=LLM_MAX_NEW_TOKENS,
+            temperature=LLM_TEMPERATURE,
+        )
+        final, fallback = _finalize(response.choices[0].message.content, reference)
+        yield _cache_answer(question, embedding, final, books, fallback)
+        return
+
+    # Generate answer via streamed chat completion
+    answer = ""
+    for chunk in client.chat_completion(
         messages=messages,
         max_tokens=LLM_MAX_NEW_TOKENS,
         temperature=LLM_TEMPERATURE,
+        stream=True,
+    ):
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            answer += token
+            yield answer
+
+    final, fallback = _finalize(answer, reference)
+    yield _cache_answer(question, embedding, final, books, fallback)
+
+
+async def ask_gandalf_async(
+    question: str, books: list[str] | None = None
+) -> AsyncIterator[str]:
+    """Async variant of :func:`ask_gandalf` for the event-loop request path.
+
+    Retrieval and context assembly run on the bounded ``retrieval_executor``
+    and generation uses ``AsyncInferenceClient``, so no thread is held while
+    waiting on the LLM.
+    """
+    loop = asyncio.get_running_loop()
+    embedding, ready, docs = await loop.run_in_executor(
+        retrieval_executor, _lookup_or_retrieve, question, books
     )
-    answer: str = response.choices[0].message.content
-    sources: list = docs
+    if ready is not None:
+        yield ready
+        return
+    # Context assembly runs the tokenizer; keep it off the event loop too
+    messages = await loop.run_in_executor(retrieval_executor, _build_messages, question, docs)
+    reference = _format_reference(docs)
 
-    # Fallback when the model punts
-    if "i don't know" in answer.lower():
-        answer = random.choice(GANDALF_QUOTES)
+    if not LLM_STREAM:
+        response = await async_client.chat_completion(
+            messages=messages,
+            max_tokens=LLM_MAX_NEW_TOKENS,
+            temperature=LLM_TEMPERATURE,
+        )
+        final, fallback = _finalize(response.choices[0].message.content, reference)
+        yield await loop.run_in_executor(
+            retrieval_executor, _cache_answer, question, embedding, final, books, fallback
+        )
+        return
 
-    # Build source citation from first retrieved chunk
-    if sources:
-        meta = sources[0].metadata
-        book = meta.get("book_name", "Unknown book")
-        chapter_num = meta.get("chapter_number", "")
-        chapter_name = meta.get("chapter_name", "Unknown chapter")
-        parts = [book]
-        if chapter_num:
-            parts.append(chapter_num)
-        if chapter_name and chapter_name != "Unknown":
-            parts.append(chapter_name)
-        reference = f"📖 Source: {', '.join(parts)}"
-    else:
-        reference = "📖 Source: Unknown"
+    answer = ""
+    stream = await async_client.chat_completion(
+        messages=messages,
+        max_tokens=LLM_MAX_NEW_TOKENS,
+        temperature=LLM_TEMPERATURE,
+        stream=True,
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            answer += token
+            yield answer
 
-    return f"{answer}\n\n{reference}"
+    # Cache writes may wait on SQLite locks; keep them off the event loop
+    final, fallback = _finalize(answer, reference)
+    yield await loop.run_in_executor(
+        retrieval_executor, _cache_answer, question, embedding, final, books, fallback
+    )
 
 
 # ── Gradio UI ─────────────────────────────────────────────────────────────
 
+def _status_update() -> tuple[str, gr.Timer]:
+    """Loading banner text; stops polling once the lore is ready."""
+    state = readiness()
+    if state["ready"]:
+        return "", gr.Timer(active=False)
+    if state["error"]:
+        banner = "*Gandalf could not find his books — see the server logs.*"
+        return banner, gr.Timer(active=False)
+    banner = "*Gandalf is gathering his lore… the first answer may take a moment.*"
+    return banner, gr.Timer(active=True)
+
+
 with gr.Blocks(
     css=CUSTOM_CSS,
     theme=GANDALF_THEME,
@@ -118,6 +430,15 @@ with gr.Blocks(
         elem_id="question",
     )
 
+    # Book filter (one choice per index shard; none selected = all books)
+    book_choices = [name for name in read_shards(FAISS_INDEX_DIR) if name]
+    books = gr.CheckboxGroup(
+        choices=book_choices,
+        label="Search only these books",
+        visible=bool(book_choices),
+        elem_id="books",
+    )
+
     # Buttons
     with gr.Row():
         clear_btn = gr.ClearButton(value="Clear")
@@ -141,10 +462,20 @@ with gr.Blocks(
         elem_id="footer",
     )
 
+    # Readiness: banner while loading, plus a JSON probe as the "readiness" API endpoint
+    status = gr.Markdown(elem_id="status")
+    status_timer = gr.Timer(1.0)
+    readiness_state = gr.JSON(visible=False)
+
     # Events
-    submit_btn.click(ask_gandalf, inputs=question, outputs=answer)
-    question.submit(ask_gandalf, inputs=question, outputs=answer)
+    submit_btn.click(ask_gandalf_async, inputs=[question, books], outputs=answer)
+    question.submit(ask_gandalf_async, inputs=[question, books], outputs=answer)
     clear_btn.add([question, answer])
+    status_timer.tick(_status_update, outputs=[status, status_timer], show_progress="hidden")
+    demo.load(_status_update, outputs=[status, status_timer], show_progress="hidden")
+    demo.load(readiness, outputs=readiness_state, api_name="readiness")
+
+demo.queue(default_concurrency_limit=CONCURRENCY_LIMIT)
 
 if __name__ == "__main__":
     demo.launch()
\ No newline at end of file
@@ -0,0 +1,457 @@
+"""Retrieval benchmarks for the Gandalf index.
+
+Usage:
+    python benchmark.py ann             # recall@k vs latency: flat vs HNSW/IVF
+    python benchmark.py ann --k 6 --queries 500
+    python benchmark.py quant           # int8 / binary codes + float re-scoring
+    python benchmark.py split           # recursive vs sentence splitter on books/
+    python benchmark.py retriever       # LangChain retriever vs native per-query cost
+    python benchmark.py hybrid          # dense vs BM25 + dense fusion, hit@k per k
+    python benchmark.py calibrate       # pick CONFIDENCE_THRESHOLD from labelled questions
+    python benchmark.py adaptive        # fixed RETRIEVAL_K vs score-driven adaptive k
+
+For ``ann`` and ``quant``, queries are a held-out random sample of the
+indexed chunk vectors; ground truth is the exact flat search over the
+remaining vectors. ``split`` rebuilds the index from the PDFs once per split
+mode and scores retrieval on the labelled questions in
+``eval_questions.json`` (a hit = a top-k chunk containing every keyword).
+``retriever`` times the same questions through ``db.as_retriever().invoke``
+and :class:`retrieval.NativeRetriever`, checking both return identical chunks.
+``hybrid`` scores dense-only and fused retrieval on the labelled questions
+at several k and times the BM25 lookup. ``calibrate`` retrieves the labelled
+questions as the app does (``ADAPTIVE_K`` or ``RETRIEVAL_K`` chunks), scores
+them against the off-topic ones in ``offtopic_questions.json`` and
+suggests the highest confidence threshold that still lets through
+``--min-recall`` of the answerable questions. ``adaptive`` compares hit@k,
+chunks and context size per question of fixed and adaptive top-k.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from config import (
+    CONFIDENCE_THRESHOLD,
+    EMBEDDING_MODEL,
+    FAISS_INDEX_DIR,
+    HNSW_EF_SEARCH,
+    IVF_NPROBE,
+    RERANK_FACTOR,
+    RETRIEVAL_K,
+    RETRIEVAL_MAX_K,
+    RETRIEVAL_MIN_K,
+)
+from index_store import (
+    ChunkStore,
+    RescoringIndex,
+    build_faiss_index,
+    embedding_settings,
+    load_vectors,
+    load_vectorstore,
+    read_shards,
+    set_search_params,
+)
+
+EVAL_QUESTIONS_FILE = "eval_questions.json"
+OFFTOPIC_QUESTIONS_FILE = "offtopic_questions.json"
+
+
+def _split(index_dir: str, n_queries: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Load the stored vectors and hold out ``n_queries`` of them as queries."""
+    vectors = np.concatenate([load_vectors(path) for path in read_shards(index_dir).values()])
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(vectors), size=min(n_queries, len(vectors) // 2), replace=False)
+    base = np.ascontiguousarray(np.delete(vectors, sample, axis=0))
+    queries = vectors[sample]
+    print(f"{len(base)} vectors, dim {base.shape[1]}, {len(queries)} held-out queries\n")
+    return base, queries
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean fraction of the exact top-k present in the approximate top-k."""
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def _timed_search(index, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Search one query at a time (as the app does); return ids and ms/query."""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    times = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids[i] = index.search(query[None, :], k)
+        times[i] = (time.perf_counter() - start) * 1000
+    return ids, times
+
+
+def _header(first: str) -> None:
+    print(f"{'index':<34} {first:>8} {'recall@k':>9} {'p50 ms':>9} {'p95 ms':>9}")
+
+
+def _report(
+    name: str, first: float, found: np.ndarray, times: np.ndarray, truth: np.ndarray
+) -> None:
+    print(
+        f"{name:<34} {first:>8.2f} {_recall(found, truth):>9.4f} "
+        f"{np.median(times):>9.3f} {np.percentile(times, 95):>9.3f}"
+    )
+
+
+def bench_ann(index_dir: str, k: int, n_queries: int, seed: int) -> None:
+    """Compare HNSW and IVF settings against the exact flat baseline."""
+    vectors, queries = _split(index_dir, n_queries, seed)
+    _header("build s")
+
+    start = time.perf_counter()
+    flat, _ = build_faiss_index(vectors, "flat")
+    build_s = time.perf_counter() - start
+    truth, times = _timed_search(flat, queries, k)
+    _report("flat (exact)", build_s, truth, times, truth)
+
+    for m in (16, 32):
+        start = time.perf_counter()
+        hnsw, params = build_faiss_index(vectors, "hnsw", hnsw_m=m)
+        build_s = time.perf_counter() - start
+        for ef_search in (16, 32, 64, 128):
+            set_search_params(hnsw, ef_search=ef_search)
+            found, times = _timed_search(hnsw, queries, k)
+            _report(f"hnsw M={m} efSearch={ef_search}", build_s, found, times, truth)
+
+    start = time.perf_counter()
+    ivf, params = build_faiss_index(vectors, "ivf")
+    build_s = time.perf_counter() - start
+    for nprobe in (1, 2, 4, 8, 16, 32):
+        if nprobe > params["nlist"]:
+            break
+        set_search_params(ivf, nprobe=nprobe)
+        found, times = _timed_search(ivf, queries, k)
+        _report(f"ivf nlist={params['nlist']} nprobe={nprobe}", build_s, found, times, truth)
+
+
+def bench_quant(index_dir: str, k: int, n_queries: int, seed: int) -> None:
+    """Compare int8 and binary codes (with float re-scoring) against flat."""
+    vectors, queries = _split(index_dir, n_queries, seed)
+    _header("index MB")
+
+    flat, _ = build_faiss_index(vectors, "flat")
+    truth, times = _timed_search(flat, queries, k)
+    _report("flat float32", len(faiss.serialize_index(flat)) / 1e6, truth, times, truth)
+
+    for quantization in ("int8", "binary"):
+        coarse, params = build_faiss_index(vectors, "flat", quantization=quantization)
+        if quantization == "binary":
+            size_mb = len(faiss.serialize_index_binary(coarse)) / 1e6
+            thresholds = np.asarray(params["thresholds"], dtype=np.float32)
+        else:
+            size_mb = len(faiss.serialize_index(coarse)) / 1e6
+            thresholds = None
+        for factor in (1, 2, 4, 8, 16):
+            index = RescoringIndex(coarse, vectors, factor, thresholds)
+            found, times = _timed_search(index, queries, k)
+            _report(f"{quantization} re-score x{factor}", size_mb, found, times, truth)
+
+
+def _load_questions(path: str) -> list[dict]:
+    """Labelled questions: ``question``, plus ``book`` and answer ``keywords`` if answerable."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _keyword_hit(text: str, keywords: list[str]) -> bool:
+    text = " ".join(text.split()).casefold()
+    return all(keyword.casefold() in text for keyword in keywords)
+
+
+def _answer_quality(results: list[list[Document]], questions: list[dict]) -> tuple[float, float]:
+    """hit@k and MRR@k of the chunks retrieved for each question."""
+    hits, reciprocal_ranks = 0, 0.0
+    for question, docs in zip(questions, results):
+        for rank, doc in enumerate(docs, start=1):
+            if _keyword_hit(doc.page_content, question["keywords"]):
+                hits += 1
+                reciprocal_ranks += 1 / rank
+                break
+    return hits / len(questions), reciprocal_ranks / len(questions)
+
+
+def bench_split(books_dir: str, questions_path: str, k: int) -> None:
+    """Compare chunk count, index size and answer hit rate per split mode."""
+    # The indexer pulls in PDF/tokenizer dependencies the other benchmarks skip
+    from indexer import SPLIT_MODES, build_index
+    from retrieval import load_retriever
+
+    questions = _load_questions(questions_path)
+    model = None
+    rows = []
+    for mode in SPLIT_MODES:
+        with tempfile.TemporaryDirectory() as index_dir:
+            build_index(books_dir=books_dir, output_dir=index_dir, split_mode=mode)
+            retriever = load_retriever(index_dir, model=model, hybrid=False)
+            model = retriever.model
+            stores = [ChunkStore(path) for path in read_shards(index_dir).values()]
+            sizes = sum(
+                os.path.getsize(os.path.join(root, name))
+                for root, _, names in os.walk(index_dir)
+                for name in names
+            )
+            chars = np.mean([
+                len(store.get(i).page_content) for store in stores for i in range(len(store))
+            ])
+            results = [retriever.invoke(question["question"], k) for question in questions]
+            hit_rate, mrr = _answer_quality(results, questions)
+            rows.append((mode, sum(map(len, stores)), chars, sizes / 1e6, hit_rate, mrr))
+
+    print(f"\n{len(questions)} labelled questions, k={k}\n")
+    print(f"{'split mode':<12} {'chunks':>8} {'avg chars':>10} {'index MB':>9} "
+          f"{'hit@k':>7} {'MRR':>7}")
+    for mode, chunks, chars, size_mb, hit_rate, mrr in rows:
+        print(f"{mode:<12} {chunks:>8} {chars:>10.0f} {size_mb:>9.2f} "
+              f"{hit_rate:>7.3f} {mrr:>7.3f}")
+
+
+def _timed(fn, *args, **kwargs) -> tuple[object, float]:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def bench_retriever(index_dir: str, questions_path: str, k: int, repeats: int) -> None:
+    """Per-query latency of the LangChain retriever vs :class:`NativeRetriever`."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    from retrieval import load_retriever
+
+    questions = [question["question"] for question in _load_questions(questions_path)]
+    search_kwargs = {"ef_search": HNSW_EF_SEARCH, "nprobe": IVF_NPROBE,
+                     "rerank_factor": RERANK_FACTOR}
+    embeddings = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        encode_kwargs={"normalize_embeddings": embedding_settings(index_dir)["normalize"]},
+    )
+    # LangChain loads one index at a time, so both paths are compared per shard
+    pairs, model = [], None
+    for shard_dir in read_shards(index_dir).values():
+        db = load_vectorstore(shard_dir, embeddings, **search_kwargs)
+        native = load_retriever(shard_dir, **search_kwargs, model=model, hybrid=False)
+        model = native.model
+        native.invoke(questions[0], k)  # warm both paths
+        db.as_retriever(search_kwargs={"k": k}).invoke(questions[0])
+        pairs.append((db, db.as_retriever(search_kwargs={"k": k}), native))
+
+    timings = {name: [] for name in ("lc invoke", "native invoke", "lc search", "native search")}
+    for _ in range(repeats):
+        for question in questions:
+            for db, langchain, native in pairs:  # interleaved so drift hits both paths alike
+                expected, ms = _timed(langchain.invoke, question)
+                timings["lc invoke"].append(ms)
+                found, ms = _timed(native.invoke, question, k)
+                timings["native invoke"].append(ms)
+                if [(d.page_content, d.metadata) for d in found] != [
+                    (d.page_content, d.metadata) for d in expected
+                ]:
+                    raise SystemExit(f"Results differ for {question!r}")
+
+                # Search only: the embedding dominates invoke, hiding wrapper cost
+                embedding = native.embed_query(question)
+                _, ms = _timed(db.similarity_search_by_vector, embedding.tolist(), k=k)
+                timings["lc search"].append(ms)
+                _, ms = _timed(native.search, embedding, k)
+                timings["native search"].append(ms)
+
+    print(f"{len(questions)} questions x {repeats} x {len(pairs)} shard(s), k={k}: "
+          "results identical\n")
+    print(f"{'path':<16} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    for name, times in timings.items():
+        print(f"{name:<16} {np.median(times):>9.3f} {np.percentile(times, 95):>9.3f} "
+              f"{np.mean(times):>9.3f}")
+    for step in ("invoke", "search"):
+        saved = np.mean(timings[f"lc {step}"]) - np.mean(timings[f"native {step}"])
+        share = saved / np.mean(timings[f"lc {step}"])
+        print(f"\n{step}: native saves {saved:.3f} ms/query ({share:.0%})", end="")
+    print()
+
+
+def bench_hybrid(index_dir: str, questions_path: str, ks: list[int]) -> None:
+    """hit@k / MRR of dense vs hybrid retrieval, plus BM25 query latency."""
+    from retrieval import HybridRetriever, load_retriever
+
+    questions = _load_questions(questions_path)
+    hybrid = load_retriever(
+        index_dir, ef_search=HNSW_EF_SEARCH, nprobe=IVF_NPROBE, rerank_factor=RERANK_FACTOR
+    )
+    if not isinstance(hybrid, HybridRetriever):
+        raise SystemExit(f"{index_dir}/ has no keyword index; rebuild it with indexer.py")
+    embeddings = [hybrid.embed_query(question["question"]) for question in questions]
+
+    print(f"{len(questions)} labelled questions\n")
+    print(f"{'retriever':<10} {'k':>3} {'hit@k':>7} {'MRR':>7}")
+    for k in ks:
+        for name, text in (("dense", False), ("hybrid", True)):
+            results = [
+                hybrid.search(embedding, k, question["question"] if text else None)
+                for question, embedding in zip(questions, embeddings)
+            ]
+            hit_rate, mrr = _answer_quality(results, questions)
+            print(f"{name:<10} {k:>3} {hit_rate:>7.3f} {mrr:>7.3f}")
+
+    positions = list(range(len(hybrid.shards)))
+    times = [
+        _timed(hybrid._lexical, question["question"], hybrid.candidates, positions)[1]
+        for _ in range(20)
+        for question in questions
+    ]
+    chunks = sum(shard.lexical.count for shard in hybrid.shards)
+    print(f"\nBM25 search: p50 {np.median(times):.3f} ms, p95 {np.percentile(times, 95):.3f} ms "
+          f"over {chunks} chunks in {len(positions)} shard(s)")
+
+
+def _suggest_threshold(answerable: np.ndarray, offtopic: np.ndarray, min_recall: float) -> float:
+    """Highest threshold keeping ``min_recall`` of ``answerable``, with a margin.
+
+    The threshold sits halfway between the lowest answerable score that must
+    pass and the next lower score of either set.
+    """
+    ordered = np.sort(answerable)
+    lowest = ordered[min(int(len(ordered) * (1 - min_recall)), len(ordered) - 1)]
+    below = np.concatenate([answerable, offtopic])
+    below = below[below < lowest]
+    return float((lowest + below.max()) / 2) if len(below) else float(lowest)
+
+
+def bench_calibrate(
+    index_dir: str, questions_path: str, offtopic_path: str, min_recall: float
+) -> None:
+    """Score answerable vs off-topic questions and suggest CONFIDENCE_THRESHOLD."""
+    from retrieval import confidence, load_retriever
+
+    retriever = load_retriever(
+        index_dir, ef_search=HNSW_EF_SEARCH, nprobe=IVF_NPROBE, rerank_factor=RERANK_FACTOR
+    )
+    scores = {}
+    for name, path in (("answerable", questions_path), ("off-topic", offtopic_path)):
+        scores[name] = np.array([
+            # Same retrieval (fixed or adaptive k) as the app applies the gate to
+            confidence(retriever.retrieve(
+                retriever.embed_query(question["question"]), question["question"]
+            ))
+            for question in _load_questions(path)
+        ])
+    answerable, offtopic = scores["answerable"], scores["off-topic"]
+
+    print(f"{'questions':<12} {'n':>4} {'min':>7} {'p5':>7} {'median':>7} {'max':>7}")
+    for name, values in scores.items():
+        print(f"{name:<12} {len(values):>4} {values.min():>7.3f} "
+              f"{np.percentile(values, 5):>7.3f} {np.median(values):>7.3f} {values.max():>7.3f}")
+
+    suggested = _suggest_threshold(answerable, offtopic, min_recall)
+    print(f"\n{'threshold':>10} {'answered':>9} {'gated':>9}")
+    everything = np.concatenate([answerable, offtopic])
+    grid = np.linspace(np.percentile(everything, 10), np.percentile(everything, 90), 9)
+    for threshold in sorted({CONFIDENCE_THRESHOLD, suggested, *grid}):
+        marks = " <- current" if threshold == CONFIDENCE_THRESHOLD else ""
+        marks += " <- suggested" if threshold == suggested else ""
+        print(f"{threshold:>10.3f} {np.mean(answerable >= threshold):>9.1%} "
+              f"{np.mean(offtopic < threshold):>9.1%}{marks}")
+    print(f"\nSuggested CONFIDENCE_THRESHOLD = {suggested:.3f} "
+          f"(answers >= {min_recall:.0%} of the labelled questions)")
+
+
+def bench_adaptive(index_dir: str, questions_path: str, min_k: int, max_k: int) -> None:
+    """hit@k, chunks and context characters of fixed vs adaptive top-k."""
+    from context import assemble_context
+    from retrieval import load_retriever
+
+    questions = _load_questions(questions_path)
+    retriever = load_retriever(
+        index_dir, ef_search=HNSW_EF_SEARCH, nprobe=IVF_NPROBE, rerank_factor=RERANK_FACTOR
+    )
+    runs = {
+        f"fixed k={RETRIEVAL_K}": lambda embedding, text: retriever.search_with_score(
+            embedding, RETRIEVAL_K, text
+        ),
+        f"adaptive {min_k}-{max_k}": lambda embedding, text: retriever.search_adaptive(
+            embedding, text, min_k=min_k, max_k=max_k
+        ),
+    }
+    embeddings = [retriever.embed_query(question["question"]) for question in questions]
+
+    print(f"{len(questions)} labelled questions\n")
+    print(f"{'retrieval':<16} {'hit@k':>7} {'MRR':>7} {'chunks':>7} {'min':>4} {'max':>4} "
+          f"{'context chars':>14}")
+    for name, search in runs.items():
+        results = [
+            [doc for doc, _ in search(embedding, question["question"])]
+            for question, embedding in zip(questions, embeddings)
+        ]
+        hit_rate, mrr = _answer_quality(results, questions)
+        counts = [len(docs) for docs in results]
+        chars = np.mean([len(assemble_context(docs, len, 10**9)) for docs in results])
+        print(f"{name:<16} {hit_rate:>7.3f} {mrr:>7.3f} {np.mean(counts):>7.2f} "
+              f"{min(counts):>4} {max(counts):>4} {chars:>14.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Gandalf retrieval")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (
+        ("ann", "Recall@k vs latency of HNSW/IVF against flat"),
+        ("quant", "Recall@k, size and latency of int8/binary codes with re-scoring"),
+    ):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("--index-dir", default=FAISS_INDEX_DIR, help="Compact index to benchmark")
+        cmd.add_argument("--k", type=int, default=RETRIEVAL_K, help="Neighbours per query")
+        cmd.add_argument("--queries", type=int, default=500, help="Number of held-out queries")
+        cmd.add_argument("--seed", type=int, default=0)
+    cmd = sub.add_parser("split", help="Chunks, index size and hit@k per split mode")
+    cmd.add_argument("--books-dir", default="books", help="Directory with source PDFs")
+    cmd.add_argument("--questions", default=EVAL_QUESTIONS_FILE, help="Labelled questions")
+    cmd.add_argument("--k", type=int, default=RETRIEVAL_K, help="Chunks retrieved per question")
+    cmd = sub.add_parser("retriever", help="Per-query cost: LangChain retriever vs native")
+    cmd.add_argument("--index-dir", default=FAISS_INDEX_DIR, help="Index to benchmark")
+    cmd.add_argument("--questions", default=EVAL_QUESTIONS_FILE, help="Questions to time")
+    cmd.add_argument("--k", type=int, default=RETRIEVAL_K, help="Chunks retrieved per question")
+    cmd.add_argument("--repeats", type=int, default=20, help="Passes over the questions")
+
+    cmd = sub.add_parser("hybrid", help="hit@k of dense vs BM25 + dense fusion")
+    cmd.add_argument("--index-dir", default=FAISS_INDEX_DIR, help="Index with bm25.npz")
+    cmd.add_argument("--questions", default=EVAL_QUESTIONS_FILE, help="Labelled questions")
+    cmd.add_argument("--k", type=int, nargs="+", default=[RETRIEVAL_K, 4, 3],
+                     help="Chunk counts to score")
+
+    cmd = sub.add_parser("calibrate", help="Pick the confidence-gate threshold")
+    cmd.add_argument("--index-dir", default=FAISS_INDEX_DIR, help="Index to calibrate on")
+    cmd.add_argument("--questions", default=EVAL_QUESTIONS_FILE,
+                     help="Questions the lore answers")
+    cmd.add_argument("--offtopic", default=OFFTOPIC_QUESTIONS_FILE,
+                     help="Questions the lore does not answer")
+    cmd.add_argument("--min-recall", type=float, default=0.95,
+                     help="Share of answerable questions that must pass the gate")
+
+    cmd = sub.add_parser("adaptive", help="Fixed vs score-driven adaptive top-k")
+    cmd.add_argument("--index-dir", default=FAISS_INDEX_DIR, help="Index to benchmark")
+    cmd.add_argument("--questions", default=EVAL_QUESTIONS_FILE, help="Labelled questions")
+    cmd.add_argument("--min-k", type=int, default=RETRIEVAL_MIN_K, help="Fewest chunks kept")
+    cmd.add_argument("--max-k", type=int, default=RETRIEVAL_MAX_K, help="Candidate pool size")
+
+    args = parser.parse_args()
+    if args.command == "adaptive":
+        bench_adaptive(args.index_dir, args.questions, args.min_k, args.max_k)
+    elif args.command == "calibrate":
+        bench_calibrate(args.index_dir, args.questions, args.offtopic, args.min_recall)
+    elif args.command == "hybrid":
+        bench_hybrid(args.index_dir, args.questions, args.k)
+    elif args.command == "split":
+        bench_split(args.books_dir, args.questions, args.k)
+    elif args.command == "retriever":
+        bench_retriever(args.index_dir, args.questions, args.k, args.repeats)
+    else:
+        bench = {"ann": bench_ann, "quant": bench_quant}[args.command]
+        bench(args.index_dir, args.k, args.queries, args.seed)
@@ -0,0 +1,433 @@
+"""Answer caches for the Gandalf chatbot.
+
+``SemanticCache`` keeps recent answers in memory and matches new questions
+against them by cosine similarity of their query embeddings, so near-identical
+questions ("What is the One Ring?" / "what's the one ring") skip retrieval and
+generation entirely.
+
+``PersistentAnswerCache`` is an optional SQLite-backed exact-match cache that
+survives restarts and is shared by every app worker on the machine.
+
+``EmbeddingCache`` is the indexer's content-addressed store of chunk vectors,
+keyed on (embedding model, chunk text hash), so re-chunking only embeds text
+that actually changed.
+
+Usage:
+    python cache.py stats               # Size, hit counts, age of entries
+    python cache.py list -n 20          # Most recently used questions
+    python cache.py clear               # Delete every cached answer
+    python cache.py vacuum              # Evict expired/excess rows, compact file
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+import numpy as np
+
+from config import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_TTL,
+)
+
+log = logging.getLogger(__name__)
+
+# Small index metadata files hashed in full by index_fingerprint: per-shard
+# store.json, shards.json and the indexer's manifest.json (PDF hashes + params)
+_FINGERPRINT_CONTENT = frozenset({"store.json", "shards.json", "manifest.json"})
+
+
+def index_fingerprint(index_dir: str) -> str:
+    """Return a short hash identifying the build of an index directory.
+
+    Used as the index version in cache keys, so rebuilding the index
+    invalidates every cached answer. Only the small metadata files are read;
+    every other file (FAISS index, chunk text, ...) contributes its name,
+    size and modification time, so startup never pages in the index itself.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(index_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, index_dir).encode("utf-8"))
+            if name in _FINGERPRINT_CONTENT:
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+            else:
+                stat = os.stat(path)
+                digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("ascii"))
+    return digest.hexdigest()[:16]
+
+
+# ── In-memory semantic cache ──────────────────────────────────────────────
+
+@dataclass
+class _Entry:
+    embedding: np.ndarray  # unit-normalised query embedding
+    answer: str
+    created: float = field(default_factory=time.monotonic)
+
+
+class SemanticCache:
+    """LRU + TTL cache of answers keyed on question-embedding similarity.
+
+    Entries are partitioned by ``namespace`` (LLM model, temperature and
+    index version), so an answer is only ever served for the configuration
+    that produced it.
+
+    Args:
+        threshold: Minimum cosine similarity for a hit.
+        max_size: Maximum number of entries across all namespaces.
+        ttl: Seconds an entry stays valid.
+    """
+
+    def __init__(self, threshold: float, max_size: int, ttl: float) -> None:
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, int], _Entry] = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalise(embedding: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    def _expire(self, now: float) -> None:
+        expired = [k for k, e in self._entries.items() if now - e.created > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, namespace: str, embedding: Sequence[float]) -> Optional[str]:
+        """Return the cached answer for the most similar question, if any."""
+        query = self._normalise(embedding)
+        with self._lock:
+            self._expire(time.monotonic())
+            keys = [k for k in self._entries if k[0] == namespace]
+            if keys:
+                matrix = np.stack([self._entries[k].embedding for k in keys])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    log.debug("Semantic cache hit (cos=%.3f)", scores[best])
+                    return self._entries[keys[best]].answer
+            self.misses += 1
+            return None
+
+    def store(self, namespace: str, embedding: Sequence[float], answer: str) -> None:
+        """Cache ``answer`` for the question with the given embedding."""
+        entry = _Entry(embedding=self._normalise(embedding), answer=answer)
+        with self._lock:
+            self._entries[(namespace, self._next_id)] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, float]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# ── Persistent exact-match cache ──────────────────────────────────────────
+
+_SCHEMA = """\
+CREATE TABLE IF NOT EXISTS answers (
+    key      TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer   TEXT NOT NULL,
+    created  REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits     INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed);
+"""
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case a question and drop punctuation and extra whitespace."""
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+
+class PersistentAnswerCache:
+    """SQLite-backed exact-match answer cache shared across processes.
+
+    The database runs in WAL mode with a busy timeout, so any number of
+    readers and writers (threads or worker processes) can use one file.
+    Rows expire after ``ttl`` seconds; past ``max_entries`` the least
+    recently used rows are evicted and freed pages are returned to the OS.
+
+    Args:
+        path: SQLite file location (parent directories are created).
+        ttl: Seconds an answer stays valid.
+        max_entries: Row cap enforced on eviction.
+        evict_every: Run eviction after this many writes from this process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float,
+        max_entries: int,
+        evict_every: int = 100,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not cross threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            # auto_vacuum only takes effect on a fresh file, before WAL is set
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA busy_timeout = 30000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(question: str, namespace: str) -> str:
+        """Hash the normalised question together with its namespace."""
+        raw = f"{normalize_question(question)}\0{namespace}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, question: str, namespace: str) -> Optional[str]:
+        """Return the cached answer for ``question``, or ``None``."""
+        key = self.make_key(question, namespace)
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT answer FROM answers WHERE key = ? AND created >= ?",
+            (key, now - self.ttl),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute(
+            "UPDATE answers SET accessed = ?, hits = hits + 1 WHERE key = ?",
+            (now, key),
+        )
+        self.hits += 1
+        return row[0]
+
+    def put(self, question: str, namespace: str, answer: str) -> None:
+        """Store (or replace) the answer for ``question``."""
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO answers (key, question, answer, created, accessed) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (self.make_key(question, namespace), question, answer, now, now),
+        )
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired rows and least-recently-used rows past the cap."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            removed = conn.execute(
+                "DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,)
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                " SELECT key FROM answers ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        if removed:
+            conn.execute("PRAGMA incremental_vacuum")
+            log.info("Answer cache: evicted %d rows", removed)
+        return removed
+
+    def vacuum(self) -> int:
+        """Evict, then rebuild the database file to reclaim all free space."""
+        removed = self.evict()
+        self._conn().execute("VACUUM")
+        return removed
+
+    def clear(self) -> int:
+        """Delete every cached answer."""
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM answers").rowcount
+        conn.execute("PRAGMA incremental_vacuum")
+        return removed
+
+    def entries(self, limit: int = 20) -> list[tuple[str, int, float]]:
+        """Most recently used ``(question, hits, accessed)`` rows."""
+        return self._conn().execute(
+            "SELECT question, hits, accessed FROM answers "
+            "ORDER BY accessed DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def stats(self) -> dict[str, float]:
+        """Row count, stored hit total and this process's counters."""
+        count, total_hits, oldest = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(hits), 0), MIN(created) FROM answers"
+        ).fetchone()
+        return {
+            "entries": count,
+            "stored_hits": total_hits,
+            "oldest_age_s": time.time() - oldest if oldest else 0.0,
+            "file_bytes": os.path.getsize(self.path),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# ── Indexer embedding cache ───────────────────────────────────────────────
+
+_EMBEDDING_SCHEMA = """\
+CREATE TABLE IF NOT EXISTS embeddings (
+    key    BLOB PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS throughput (
+    model           TEXT PRIMARY KEY,
+    chunks_per_sec  REAL NOT NULL
+);
+"""
+
+
+class EmbeddingCache:
+    """Content-addressed SQLite store of float32 chunk embeddings.
+
+    Keys hash the model name with the exact text that is encoded, so a
+    chunk is only ever re-embedded when its text (or the model) changes.
+    The last measured encode throughput per model is kept too, to estimate
+    the time each hit saved.
+
+    Args:
+        path: SQLite file location (parent directories are created).
+        model: Embedding model name, part of every key.
+    """
+
+    _BATCH = 500  # keys per SELECT (SQLite bound-parameter limit)
+
+    def __init__(self, path: str, model: str) -> None:
+        self.path = path
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(_EMBEDDING_SCHEMA)
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: list[str]) -> dict[int, np.ndarray]:
+        """Return cached vectors by position in ``texts``."""
+        keys = [self._key(text) for text in texts]
+        positions: dict[bytes, list[int]] = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, []).append(i)
+        unique = list(positions)
+        found: dict[int, np.ndarray] = {}
+        for start in range(0, len(unique), self._BATCH):
+            batch = unique[start:start + self._BATCH]
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                for i in positions[key]:
+                    found[i] = vector
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, texts: list[str], vectors: np.ndarray, seconds: float) -> None:
+        """Store freshly encoded ``vectors`` and the time it took to encode them."""
+        rows = [
+            (self._key(text), np.asarray(vector, dtype=np.float32).tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+            )
+            if texts and seconds > 0:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO throughput (model, chunks_per_sec) VALUES (?, ?)",
+                    (self.model, len(texts) / seconds),
+                )
+        self.encode_seconds += seconds
+
+    def summary(self) -> str:
+        """One-line hit rate and estimated time saved."""
+        lookups = self.hits + self.misses
+        if not lookups:
+            return "Embedding cache: no lookups"
+        row = self._conn.execute(
+            "SELECT chunks_per_sec FROM throughput WHERE model = ?", (self.model,)
+        ).fetchone()
+        saved = f"~{self.hits / row[0]:.1f}s saved" if row else "time saved unknown"
+        return (
+            f"Embedding cache: {self.hits}/{lookups} hits ({100 * self.hits / lookups:.1f}%), "
+            f"{saved}, {self.encode_seconds:.1f}s spent embedding misses"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the Gandalf answer cache")
+    parser.add_argument("command", choices=["stats", "list", "clear", "vacuum"])
+    parser.add_argument(
+        "--path",
+        default=ANSWER_CACHE_PATH,
+        help=f"SQLite cache file (default: {ANSWER_CACHE_PATH})",
+    )
+    parser.add_argument("-n", type=int, default=20, help="Rows to show for 'list'")
+    args = parser.parse_args()
+
+    store = PersistentAnswerCache(args.path, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES)
+    if args.command == "stats":
+        for name, value in store.stats().items():
+            print(f"{name:>14}: {value}")
+    elif args.command == "list":
+        for question, hits, accessed in store.entries(args.n):
+            stamp = time.strftime("%Y-%m-%d %H:%M", time.localtime(accessed))
+            print(f"{stamp}  {hits:>5}  {question}")
+    elif args.command == "clear":
+        print(f"Removed {store.clear()} cached answers.")
+    else:
+        print(f"Evicted {store.vacuum()} rows; file is now {os.path.getsize(args.path)} bytes.")
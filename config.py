@@ -5,8 +5,64 @@
 # ---------------------------------------------------------------------------
 EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
 FAISS_INDEX_DIR: str = "gandalf_index"
-CHUNK_SIZE: int = 500
-CHUNK_OVERLAP: int = 100
+SPLIT_MODE: str = "recursive"  # "recursive" (characters) or "sentence" (chapter-aware)
+CHUNK_SIZE: int = 500  # recursive: characters per chunk
+CHUNK_OVERLAP: int = 100  # recursive: characters shared by neighbouring chunks
+CHUNK_TOKENS: int = 200  # sentence: tokenizer budget per chunk (model limit is 256)
+CHUNK_OVERLAP_TOKENS: int = 40  # sentence: whole sentences repeated from the last chunk
+INDEX_JOBS: int = 0  # book parsing + PDF extraction processes (0 = one per CPU)
+PIPELINE_BATCH_SIZE: int = 2048  # chunks embedded and indexed per step (bounds memory)
+DEDUP_ENABLED: bool = True  # strip running headers/footers, drop near-duplicate chunks
+BOILERPLATE_MIN_PAGES: int = 4  # page-edge lines recurring this often are headers/footers
+NEAR_DUPLICATE_THRESHOLD: float = 0.85  # MinHash Jaccard at which a chunk is a duplicate
+PAGE_CACHE_DIR: str = ".cache/pages"  # extracted PDF text ("" disables the cache)
+EMBED_BATCH_SIZE: int = 64  # chunks per model forward pass
+EMBED_MULTI_PROCESS: bool = False  # sentence-transformers pool across CPU cores
+EMBED_NORMALIZE: bool = False  # unit-length vectors (L2 ranking == cosine)
+EMBED_CACHE_PATH: str = ".cache/embeddings.sqlite3"  # "" disables the cache
+RETRIEVAL_K: int = 6  # chunks per question when ADAPTIVE_K is off
+
+# Adaptive top-k: fetch RETRIEVAL_MAX_K candidates, keep fewer when the best stand out
+ADAPTIVE_K: bool = True
+RETRIEVAL_MIN_K: int = 2
+RETRIEVAL_MAX_K: int = 10
+ADAPTIVE_SCORE_GAP: float = 0.1  # cut before a similarity drop this large
+ADAPTIVE_RELEVANCE_MASS: float = 0.9  # ... or once kept chunks hold this share of relevance
+ADAPTIVE_TEMPERATURE: float = 0.05  # softmax temperature turning similarities into relevance
+
+# Hybrid search: BM25 keyword hits fused with dense hits (reciprocal rank fusion)
+HYBRID_SEARCH: bool = True  # needs bm25.npz (written by indexer.py)
+HYBRID_CANDIDATES: int = 20  # hits taken from each retriever before fusion
+RRF_K: int = 60  # fusion damping: score = sum of 1 / (RRF_K + rank)
+BM25_K1: float = 1.2  # term-frequency saturation
+BM25_B: float = 0.75  # chunk-length normalisation
+SHARD_WORKERS: int = 4  # threads an unscoped query fans out on across book shards
+
+# FAISS index type: "flat" (exact), "hnsw" or "ivf" (approximate)
+INDEX_TYPE: str = "flat"
+HNSW_M: int = 32  # build: graph neighbours per node
+HNSW_EF_CONSTRUCTION: int = 200  # build: construction search depth
+HNSW_EF_SEARCH: int = 64  # query: higher = better recall, slower
+IVF_NLIST: int = 0  # build: number of lists (0 = 4 * sqrt(chunks))
+IVF_NPROBE: int = 8  # query: lists scanned per search
+
+# Compressed vectors: "none" (float32), "int8" or "binary", re-scored in float
+QUANTIZATION: str = "none"
+RERANK_FACTOR: int = 4  # query: candidates re-scored per chunk (binary: try 8-16)
+
+# ---------------------------------------------------------------------------
+# Answer cache
+# ---------------------------------------------------------------------------
+SEMANTIC_CACHE_ENABLED: bool = True
+SEMANTIC_CACHE_THRESHOLD: float = 0.92  # cosine similarity for a cache hit
+SEMANTIC_CACHE_MAX_SIZE: int = 512  # entries (LRU eviction)
+SEMANTIC_CACHE_TTL: float = 3600.0  # seconds
+
+# Optional on-disk exact-match cache shared by all workers (SQLite)
+ANSWER_CACHE_ENABLED: bool = False
+ANSWER_CACHE_PATH: str = ".cache/answers.sqlite3"
+ANSWER_CACHE_TTL: float = 7 * 24 * 3600.0  # seconds
+ANSWER_CACHE_MAX_ENTRIES: int = 10_000
 
 # ---------------------------------------------------------------------------
 # LLM
@@ -14,6 +70,20 @@ CHUNK_OVERLAP: int = 100
 LLM_MODEL: str = "Qwen/Qwen2.5-7B-Instruct"
 LLM_TEMPERATURE: float = 0.7
 LLM_MAX_NEW_TOKENS: int = 512
+LLM_STREAM: bool = True  # stream tokens to the UI as they are generated
+CONTEXT_TOKEN_BUDGET: int = 1500  # lore tokens per prompt (counted with LLM_MODEL's tokenizer)
+
+# Retrieval-confidence gate: answer with a fallback quote, without calling the
+# LLM, when no retrieved chunk is this similar to the question. Off until a
+# threshold is calibrated on the deployed index (benchmark.py calibrate).
+CONFIDENCE_GATE_ENABLED: bool = False
+CONFIDENCE_THRESHOLD: float = 0.25  # cosine similarity (placeholder, not calibrated)
+
+# ---------------------------------------------------------------------------
+# Serving
+# ---------------------------------------------------------------------------
+RETRIEVAL_WORKERS: int = 4  # threads for the CPU-bound embed + FAISS step
+CONCURRENCY_LIMIT: int = 32  # concurrent Gradio requests per event
 
 # ---------------------------------------------------------------------------
 # Prompt
@@ -37,7 +107,7 @@ Question:
 {question}"""
 
 # ---------------------------------------------------------------------------
-# Fallback quotes (used when the LLM says "I don't know")
+# Fallback quotes (used when the LLM says "I don't know" or the confidence gate trips)
 # ---------------------------------------------------------------------------
 GANDALF_QUOTES: list[str] = [
     "Even the wisest cannot answer all questions.",
@@ -205,6 +275,12 @@ CUSTOM_CSS: str = """\
     letter-spacing: 0.05em !important;
 }
 
+/* Loading banner */
+#status {
+    text-align: center !important;
+    color: #8c7a56 !important;
+}
+
 /* Footer */
 #footer {
     text-align: center !important;
@@ -0,0 +1,156 @@
+"""Prompt context assembly: merge, de-duplicate and budget retrieved chunks.
+
+Neighbouring chunks share ``CHUNK_OVERLAP`` characters, and a question often
+retrieves several consecutive chunks of one chapter. Joining them verbatim
+sends the overlap twice and splits one passage into fragments.
+:func:`assemble_context` instead:
+
+1. merges chunks that are consecutive rows of the same book into one
+   passage, keeping their shared overlap once;
+2. drops passages whose text is already contained in another;
+3. admits passages in order of their best retrieval rank until
+   ``CONTEXT_TOKEN_BUDGET`` tokens of the LLM's tokenizer are used;
+4. emits the admitted passages in reading order, books ordered by their
+   best hit.
+
+Chunk positions come from ``Document.id`` (the row number set by
+``index_store``); chunks without one are kept as separate passages.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from index_store import shared_prefix
+
+log = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4  # estimate used when the LLM tokenizer cannot be loaded
+
+
+def load_token_counter(model: str) -> Callable[[str], int]:
+    """Token counter for ``model``'s tokenizer, or a character estimate.
+
+    Only the tokenizer files are downloaded (a few MB); without them (e.g.
+    offline) the count falls back to ``len(text) / CHARS_PER_TOKEN``.
+    """
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model)
+    except Exception:  # noqa: BLE001 — any failure means "no tokenizer"
+        log.warning("Could not load the %s tokenizer; estimating context tokens", model)
+        return lambda text: -(-len(text) // CHARS_PER_TOKEN)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+@dataclass
+class _Passage:
+    """Consecutive chunks of one book, merged."""
+
+    book: str
+    last_row: Optional[int]
+    rank: int  # best retrieval rank of its chunks (0 = top hit)
+    text: str
+    tokens: int = 0
+
+
+def _row(doc: Document) -> Optional[int]:
+    return int(doc.id) if doc.id is not None and str(doc.id).isdigit() else None
+
+
+def _join(previous: str, text: str) -> str:
+    """Append ``text`` to the preceding chunk, keeping their overlap once."""
+    shared = shared_prefix(previous, text)
+    return previous + text[shared:] if shared else f"{previous}\n{text}"
+
+
+def _merge(docs: Sequence[Document]) -> list[_Passage]:
+    """Group ``docs`` into passages of consecutive rows, in reading order."""
+    ranked = [
+        (doc.metadata.get("book_name", ""), _row(doc), rank, doc)
+        for rank, doc in enumerate(docs)
+    ]
+    book_order: dict[str, int] = {}
+    for book, _, _, _ in ranked:
+        book_order.setdefault(book, len(book_order))
+    positioned = sorted(
+        (item for item in ranked if item[1] is not None),
+        key=lambda item: (book_order[item[0]], item[1]),
+    )
+
+    passages: list[_Passage] = []
+    for book, row, rank, doc in positioned:
+        last = passages[-1] if passages else None
+        if last is not None and last.book == book and last.last_row is not None:
+            if row == last.last_row:
+                last.rank = min(last.rank, rank)  # same chunk retrieved twice
+                continue
+            if row == last.last_row + 1:
+                last.text = _join(last.text, doc.page_content)
+                last.last_row = row
+                last.rank = min(last.rank, rank)
+                continue
+        passages.append(_Passage(book, row, rank, doc.page_content))
+    passages.extend(
+        _Passage(book, None, rank, doc.page_content)
+        for book, row, rank, doc in ranked
+        if row is None
+    )
+    return passages
+
+
+def assemble_context(
+    docs: Sequence[Document],
+    count_tokens: Callable[[str], int],
+    budget: int,
+) -> str:
+    """Build the prompt context from retrieved ``docs`` (best first).
+
+    Args:
+        docs: Retrieved chunks, most relevant first.
+        count_tokens: The LLM tokenizer's token count of a text.
+        budget: Maximum context tokens; the best passage is always kept,
+            cut down to the budget if it alone exceeds it.
+
+    Returns:
+        Passages in reading order, separated by blank lines.
+    """
+    passages = []
+    merged = _merge(docs)
+    for i, passage in enumerate(merged):
+        container = next(
+            (
+                other
+                for j, other in enumerate(merged)
+                if j != i and passage.text in other.text and (passage.text != other.text or j < i)
+            ),
+            None,
+        )
+        if container is None:
+            passages.append(passage)
+        else:
+            container.rank = min(container.rank, passage.rank)
+
+    used, admitted = 0, []
+    for passage in sorted(passages, key=lambda passage: passage.rank):
+        passage.tokens = count_tokens(passage.text)
+        if used + passage.tokens <= budget:
+            admitted.append(passage)
+            used += passage.tokens
+        elif not admitted:
+            # Even the best passage is too long: keep its share of the budget
+            passage.text = passage.text[: len(passage.text) * budget // passage.tokens]
+            admitted.append(passage)
+            used = budget
+    log.debug(
+        "Context: %d chunks -> %d passages, %d tokens", len(docs), len(admitted), used
+    )
+    order = {id(passage): i for i, passage in enumerate(passages)}
+    admitted.sort(key=lambda passage: order[id(passage)])
+    return "\n\n".join(passage.text for passage in admitted)
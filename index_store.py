@@ -0,0 +1,827 @@
+"""On-disk lore index: memory-mapped FAISS vectors plus a compact docstore.
+
+An index directory written by :class:`IndexWriter` holds:
+
+    index.faiss   FAISS index (flat/HNSW/IVF) of float32, int8 or binary codes,
+                  opened read-only with mmap IO flags
+    vectors.npy   full-precision vectors for re-scoring (int8/binary indexes
+                  only; flat/HNSW/IVF indexes already hold them)
+    text.bin      UTF-8 book text, each book's chunks in order; text a chunk
+                  shares with the previous (overlapping) chunk is stored once
+    chunks.npy    per-chunk byte offsets, source book and interned metadata ids
+    bm25.npz      inverted index of chunk tokens (term -> rows, term counts)
+                  for BM25 keyword search
+    store.json    format version, embedding settings, index type/build params,
+                  metadata columns and string table
+
+Nothing is unpickled at load time. Chunk text and metadata are decoded lazily
+for each search hit, and every worker process shares one page-cached copy of
+the files. Quantized indexes search the compact codes for ``k * rerank_factor``
+candidates and re-rank them by exact L2 distance over ``vectors.npy``, which
+is memory-mapped so only the candidate rows are ever read.
+
+A sharded index keeps one such directory per book, named by
+:func:`shard_slug`, and lists them in corpus order in ``shards.json``; each
+shard can be searched on its own or alongside the others.
+
+Directories written by LangChain's ``FAISS.save_local`` (``index.faiss`` +
+``index.pkl``) still load through the legacy path.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import pickle
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from typing import Optional, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+INDEX_FILE = "index.faiss"
+TEXT_FILE = "text.bin"
+CHUNKS_FILE = "chunks.npy"
+VECTORS_FILE = "vectors.npy"
+STORE_FILE = "store.json"
+BM25_FILE = "bm25.npz"
+SHARDS_FILE = "shards.json"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+VECTORS_SPOOL = "vectors.f32"  # raw rows while an IndexWriter is open
+
+TRAIN_SAMPLE_SIZE = 65_536  # vectors sampled to train IVF/quantized indexes
+_ADD_BLOCK = 16_384  # rows per FAISS add when filling from the spool
+_MIN_SHARED_TEXT = 16  # shortest chunk overlap worth sharing in text.bin
+
+# Chunk metadata columns, stored as ids into the interned string table
+METADATA_KEYS: tuple[str, ...] = ("book_name", "chapter_number", "chapter_name")
+
+INDEX_TYPES: tuple[str, ...] = ("flat", "hnsw", "ivf")
+QUANTIZATIONS: tuple[str, ...] = ("none", "int8", "binary")
+
+# Zero-copy mmap where this FAISS build supports it
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _chunk_dtype() -> np.dtype:
+    return np.dtype(
+        [("start", "<u8"), ("end", "<u8"), ("source", "<i4")]
+        + [(key, "<i4") for key in METADATA_KEYS]
+    )
+
+
+def is_compact_index(index_dir: str) -> bool:
+    """True if ``index_dir`` was written by :class:`IndexWriter`."""
+    return os.path.exists(os.path.join(index_dir, STORE_FILE))
+
+
+def read_store_info(index_dir: str) -> dict:
+    """Return the parsed ``store.json`` of a compact index."""
+    with open(os.path.join(index_dir, STORE_FILE), encoding="utf-8") as f:
+        info = json.load(f)
+    if info["format"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format {info['format']} in {index_dir}/")
+    return info
+
+
+def embedding_settings(index_dir: str) -> dict:
+    """Embedding ``model`` and ``normalize`` flag an index was built with.
+
+    Queries must be embedded the same way; legacy indexes were built
+    without normalisation and record no model.
+    """
+    default = {"model": None, "normalize": False}
+    shard_dirs = list(read_shards(index_dir).values())
+    if not shard_dirs or not is_compact_index(shard_dirs[0]):
+        return default
+    return read_store_info(shard_dirs[0]).get("embedding", default)
+
+
+def shard_slug(name: str) -> str:
+    """Directory name of the shard for book ``name`` (``the-two-towers``)."""
+    return re.sub(r"[^a-z0-9]+", "-", name.casefold()).strip("-") or "shard"
+
+
+def read_shards(index_dir: str) -> dict[str, str]:
+    """Book name -> index directory of every shard, in corpus order.
+
+    An unsharded (single compact or legacy) index is one shard named ``""``;
+    a missing index has none.
+    """
+    path = os.path.join(index_dir, SHARDS_FILE)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            shards = json.load(f)["shards"]
+        return {shard["name"]: os.path.join(index_dir, shard["dir"]) for shard in shards}
+    if os.path.exists(os.path.join(index_dir, INDEX_FILE)):
+        return {"": index_dir}
+    return {}
+
+
+def write_shards(index_dir: str, names: Sequence[str]) -> None:
+    """List the shards of ``index_dir`` (subdirectories named by :func:`shard_slug`)."""
+    path = os.path.join(index_dir, SHARDS_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(
+            {"format": FORMAT_VERSION, "shards": [{"name": n, "dir": shard_slug(n)} for n in names]},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    os.replace(f"{path}.tmp", path)
+
+
+# ── Vector index ──────────────────────────────────────────────────────────
+
+def binarize(vectors: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """Pack one bit per dimension: set where the value exceeds its threshold."""
+    return np.packbits(vectors > thresholds, axis=1)
+
+
+def _create_index(
+    dim: int,
+    n: int,
+    index_type: str,
+    quantization: str,
+    hnsw_m: int,
+    hnsw_ef_construction: int,
+    ivf_nlist: int,
+) -> tuple[Union[faiss.Index, faiss.IndexBinary], dict]:
+    """Return an empty index for ``n`` vectors and its build parameters."""
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(
+            f"Unknown quantization: {quantization} (expected one of {QUANTIZATIONS})"
+        )
+
+    if quantization == "binary":
+        if index_type != "flat":
+            raise ValueError("Binary codes are only supported with a flat index.")
+        return faiss.IndexBinaryFlat(dim), {"type": "flat", "quantization": "binary"}
+
+    int8 = quantization == "int8"
+    qtype = faiss.ScalarQuantizer.QT_8bit
+    if index_type == "flat":
+        index = faiss.IndexScalarQuantizer(dim, qtype) if int8 else faiss.IndexFlatL2(dim)
+        params: dict = {"type": "flat"}
+    elif index_type == "hnsw":
+        if int8:
+            index = faiss.IndexHNSWSQ(dim, qtype, hnsw_m)
+        else:
+            index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = hnsw_ef_construction
+        params = {"type": "hnsw", "m": hnsw_m, "ef_construction": hnsw_ef_construction}
+    elif index_type == "ivf":
+        # FAISS wants ~39 training points per centroid
+        nlist = ivf_nlist or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n // 39))
+        quantizer = faiss.IndexFlatL2(dim)
+        if int8:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        params = {"type": "ivf", "nlist": nlist}
+    else:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+    params["quantization"] = quantization
+    return index, params
+
+
+def _needs_training(index_type: str, quantization: str) -> bool:
+    """True if the index must see (a sample of) the corpus before ``add``."""
+    return index_type == "ivf" or quantization != "none"
+
+
+def build_faiss_index(
+    vectors: np.ndarray,
+    index_type: str = "flat",
+    quantization: str = "none",
+    hnsw_m: int = 32,
+    hnsw_ef_construction: int = 200,
+    ivf_nlist: int = 0,
+) -> tuple[Union[faiss.Index, faiss.IndexBinary], dict]:
+    """Build an L2 FAISS index over ``vectors``.
+
+    Args:
+        vectors: ``(n, d)`` float32 embeddings, row ``i`` = chunk ``i``.
+        index_type: ``flat`` (exact), ``hnsw`` (graph) or ``ivf`` (inverted lists).
+        quantization: ``none`` (float32), ``int8`` (scalar quantizer) or
+            ``binary`` (one bit per dimension, Hamming distance; flat only).
+        hnsw_m: Graph neighbours per node for ``hnsw``.
+        hnsw_ef_construction: Build-time search depth for ``hnsw``.
+        ivf_nlist: Number of IVF lists; ``0`` picks ``4 * sqrt(n)``.
+
+    Returns:
+        The populated index and the build parameters to store alongside it.
+    """
+    n, dim = vectors.shape
+    index, params = _create_index(
+        dim, n, index_type, quantization, hnsw_m, hnsw_ef_construction, ivf_nlist
+    )
+    if quantization == "binary":
+        # Centre each dimension so its bit splits the corpus roughly in half
+        thresholds = vectors.mean(axis=0)
+        index.add(binarize(vectors, thresholds))
+        params["thresholds"] = thresholds.tolist()
+        return index, params
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index, params
+
+
+class RescoringIndex:
+    """Coarse search over quantized codes, exact L2 re-scoring of candidates.
+
+    Implements the ``d`` / ``ntotal`` / ``search`` subset of ``faiss.Index``
+    that LangChain's FAISS wrapper uses, returning squared L2 distances like
+    an exact flat index.
+
+    Args:
+        coarse: int8 index, or binary index searched with Hamming distance.
+        vectors: Full-precision vectors (typically a read-only memmap).
+        rerank_factor: Candidates fetched per requested neighbour.
+        thresholds: Per-dimension binarisation thresholds (binary only).
+    """
+
+    def __init__(
+        self,
+        coarse: Union[faiss.Index, faiss.IndexBinary],
+        vectors: np.ndarray,
+        rerank_factor: int,
+        thresholds: Optional[np.ndarray] = None,
+    ) -> None:
+        self.coarse = coarse
+        self.vectors = vectors
+        self.rerank_factor = max(1, rerank_factor)
+        self.thresholds = thresholds
+        self.d = vectors.shape[1]
+        self.ntotal = coarse.ntotal
+
+    def search(self, x: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        n_candidates = min(self.ntotal, k * self.rerank_factor)
+        codes = binarize(x, self.thresholds) if self.thresholds is not None else x
+        _, candidates = self.coarse.search(codes, n_candidates)
+
+        distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        labels = np.full((len(x), k), -1, dtype=np.int64)
+        for row, (query, ids) in enumerate(zip(x, candidates)):
+            ids = np.sort(ids[ids >= 0])  # ascending rows = sequential page reads
+            if not len(ids):
+                continue
+            exact = ((self.vectors[ids] - query) ** 2).sum(axis=1)
+            top = np.argsort(exact, kind="stable")[:k]
+            distances[row, :len(top)] = exact[top]
+            labels[row, :len(top)] = ids[top]
+        return distances, labels
+
+
+def set_search_params(
+    index: faiss.Index,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+) -> None:
+    """Apply query-time knobs (``efSearch`` for HNSW, ``nprobe`` for IVF)."""
+    if isinstance(index, faiss.IndexBinary):
+        return
+    index = faiss.downcast_index(index)
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    if nprobe is not None and isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe
+
+
+def load_vectors(index_dir: str, mmap: bool = False) -> np.ndarray:
+    """Return every stored vector of a compact index as float32.
+
+    ``vectors.npy`` is read when present (memory-mapped with ``mmap``);
+    older indexes without it have their vectors reconstructed from FAISS.
+    """
+    vectors_path = os.path.join(index_dir, VECTORS_FILE)
+    if os.path.exists(vectors_path):
+        return np.load(vectors_path, mmap_mode="r" if mmap else None)
+    index = faiss.read_index(os.path.join(index_dir, INDEX_FILE))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+# ── Lexical index ─────────────────────────────────────────────────────────
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_COMBINING_MARKS = re.compile(r"[\u0300-\u036f]")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased word tokens with diacritics removed ("Eärendil" -> "earendil").
+
+    Chunks and queries go through the same function, so a query typed
+    without accents still matches the accented name in the books.
+    """
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    return _TOKEN_PATTERN.findall(_COMBINING_MARKS.sub("", folded))
+
+
+class BM25Index:
+    """Okapi BM25 over the inverted index in ``bm25.npz``.
+
+    Postings are stored per term as CSR arrays (``offsets`` into ``rows`` /
+    ``tf``). The BM25 weight of every posting is computed once at load, so
+    scoring a query only adds up the postings of its distinct terms.
+
+    Args:
+        index_dir: Compact index directory containing ``bm25.npz``.
+        k1: Term-frequency saturation.
+        b: Document-length normalisation.
+    """
+
+    def __init__(self, index_dir: str, k1: float = 1.2, b: float = 0.75) -> None:
+        with np.load(os.path.join(index_dir, BM25_FILE)) as data:
+            terms = data["terms"].tobytes().decode("utf-8")
+            self._offsets = data["offsets"]
+            self._rows = data["rows"]
+            tf = data["tf"].astype(np.float32)
+            lengths = data["lengths"].astype(np.float32)
+        self._term_ids = {term: i for i, term in enumerate(terms.split("\n"))} if terms else {}
+        self.count = len(lengths)
+
+        df = np.diff(self._offsets)
+        idf = np.log1p((self.count - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()), 1.0))
+        self._weights = np.repeat(idf, df) * tf * (k1 + 1) / (tf + norm[self._rows])
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for ``query`` (0 where no term matches)."""
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self._term_ids.get(term)
+            if i is not None:
+                start, end = self._offsets[i], self._offsets[i + 1]
+                scores[self._rows[start:end]] += self._weights[start:end]
+        return scores
+
+    def search(self, query: str, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Scores and rows of the (at most) ``k`` best-scoring chunks, best first."""
+        scores = self.scores(query)
+        rows = np.flatnonzero(scores)
+        if len(rows) > k:
+            rows = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        return scores[rows], rows
+
+
+def load_bm25(index_dir: str, k1: float = 1.2, b: float = 0.75) -> Optional[BM25Index]:
+    """Open the keyword index of ``index_dir``, or ``None`` if it has none."""
+    if not os.path.exists(os.path.join(index_dir, BM25_FILE)):
+        return None
+    return BM25Index(index_dir, k1=k1, b=b)
+
+
+# ── Writing ───────────────────────────────────────────────────────────────
+
+def shared_prefix(previous: str, text: str) -> int:
+    """Length of the longest prefix of ``text`` that ends ``previous``.
+
+    This is the overlap the splitter gave two consecutive chunks; matches
+    shorter than ``_MIN_SHARED_TEXT`` characters are ignored.
+    """
+    if len(text) < _MIN_SHARED_TEXT or len(previous) < _MIN_SHARED_TEXT:
+        return 0
+    probe = text[:_MIN_SHARED_TEXT]
+    i = previous.find(probe, max(0, len(previous) - len(text)))
+    while i != -1:
+        if text.startswith(previous[i:]):
+            return len(previous) - i
+        i = previous.find(probe, i + 1)
+    return 0
+
+
+class IndexWriter:
+    """Stream chunks and their vectors into a compact index directory.
+
+    Batches passed to :meth:`add` are written straight to disk: chunk text
+    is appended to ``text.bin`` (minus any overlap with the previous chunk
+    of the same source, which the two records share) and vectors to a
+    spool file, each chunk's tokens are added to the BM25 postings, and
+    indexes that need no training (float flat/HNSW) receive each batch
+    immediately.
+    IVF and quantized indexes are trained on a sample of the spooled
+    vectors at :meth:`commit` and then filled block by block, so memory
+    does not grow with the corpus beyond the FAISS index itself.
+
+    Every file is written under a temporary name and renamed into place on
+    :meth:`commit`, so a running app (or an incremental build reading the
+    previous index) keeps its memory-mapped old files. Leaving the ``with``
+    block without committing discards the temporary files.
+
+    Args:
+        index_dir: Output directory.
+        index_type: ``flat``, ``hnsw`` or ``ivf``.
+        quantization: ``none``, ``int8`` or ``binary``.
+        hnsw_m: HNSW graph neighbours per node.
+        hnsw_ef_construction: HNSW construction search depth.
+        ivf_nlist: IVF list count (``0`` = ``4 * sqrt(n)``).
+        train_size: Maximum vectors sampled to train IVF/quantized indexes.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        index_type: str = "flat",
+        quantization: str = "none",
+        hnsw_m: int = 32,
+        hnsw_ef_construction: int = 200,
+        ivf_nlist: int = 0,
+        train_size: int = TRAIN_SAMPLE_SIZE,
+    ) -> None:
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown quantization: {quantization} (expected one of {QUANTIZATIONS})"
+            )
+        self.index_dir = index_dir
+        self.index_type = index_type
+        self.quantization = quantization
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.ivf_nlist = ivf_nlist
+        self.train_size = train_size
+        self.count = 0
+        self.dim: Optional[int] = None
+
+        os.makedirs(index_dir, exist_ok=True)
+        self._text = open(self._tmp(TEXT_FILE), "wb")
+        self._spool = open(self._tmp(VECTORS_SPOOL), "wb")
+        self._text_offset = 0
+        self._text_shared = 0
+        self._previous: tuple[Optional[str], str] = (None, "")
+        self._records: list[np.ndarray] = []
+        self._strings: list[str] = []
+        self._string_ids: dict[str, int] = {}
+        self._terms: dict[str, int] = {}
+        self._postings = {name: array("i") for name in ("terms", "rows", "tf")}
+        self._lengths = array("i")
+        self._index: Optional[faiss.Index] = None
+        self._params: dict = {}
+        self._closed = False
+
+    def _tmp(self, name: str) -> str:
+        return os.path.join(self.index_dir, f"{name}.tmp")
+
+    def _intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        if value not in self._string_ids:
+            self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return self._string_ids[value]
+
+    def __enter__(self) -> "IndexWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if not self._closed:
+            self.abort()
+
+    def add(
+        self,
+        docs: Sequence[Document],
+        vectors: np.ndarray,
+        source: Optional[str] = None,
+    ) -> None:
+        """Append ``docs`` and their ``(len(docs), d)`` vectors.
+
+        Args:
+            docs: Chunks, in index order.
+            vectors: Full-precision embeddings, row ``i`` = ``docs[i]``.
+            source: Key of the book the chunks came from.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) != len(docs):
+            raise ValueError(f"{len(vectors)} vectors for {len(docs)} documents.")
+        if not len(docs):
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            if not _needs_training(self.index_type, self.quantization):
+                self._index, self._params = _create_index(
+                    self.dim, 0, self.index_type, self.quantization,
+                    self.hnsw_m, self.hnsw_ef_construction, self.ivf_nlist,
+                )
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[1]}-d.")
+
+        records = np.empty(len(docs), dtype=_chunk_dtype())
+        source_id = self._intern(source)
+        for i, doc in enumerate(docs):
+            text = doc.page_content
+            previous_source, previous_text = self._previous
+            shared = shared_prefix(previous_text, text) if previous_source == source else 0
+            data = text.encode("utf-8")
+            shared_bytes = len(text[:shared].encode("utf-8"))
+            self._text.write(data[shared_bytes:])
+            records[i]["start"] = self._text_offset - shared_bytes
+            self._text_offset += len(data) - shared_bytes
+            self._text_shared += shared_bytes
+            records[i]["end"] = self._text_offset
+            self._previous = (source, text)
+            records[i]["source"] = source_id
+            for key in METADATA_KEYS:
+                records[i][key] = self._intern(doc.metadata.get(key))
+            self._add_postings(self.count + i, text)
+        self._records.append(records)
+        self._spool.write(vectors.tobytes())
+        if self._index is not None:
+            self._index.add(vectors)
+        self.count += len(docs)
+
+    def _add_postings(self, row: int, text: str) -> None:
+        tokens = tokenize(text)
+        self._lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self._postings["terms"].append(self._terms.setdefault(term, len(self._terms)))
+            self._postings["rows"].append(row)
+            self._postings["tf"].append(tf)
+
+    def _write_bm25(self) -> None:
+        """Group the postings by term (rows stay ascending) into ``bm25.npz``."""
+        terms = np.frombuffer(self._postings["terms"], dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(self._terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self._terms)), out=offsets[1:])
+        tf = np.frombuffer(self._postings["tf"], dtype=np.int32)[order]
+        with open(self._tmp(BM25_FILE), "wb") as f:
+            np.savez(
+                f,
+                terms=np.frombuffer("\n".join(self._terms).encode("utf-8"), dtype=np.uint8),
+                offsets=offsets,
+                rows=np.frombuffer(self._postings["rows"], dtype=np.int32)[order],
+                tf=np.minimum(tf, np.iinfo(np.uint16).max).astype(np.uint16),
+                lengths=np.frombuffer(self._lengths, dtype=np.int32),
+            )
+
+    def _build_from_spool(self, vectors: np.ndarray) -> None:
+        """Train on a sample of the spooled vectors, then add them in blocks."""
+        n = len(vectors)
+        self._index, self._params = _create_index(
+            self.dim, n, self.index_type, self.quantization,
+            self.hnsw_m, self.hnsw_ef_construction, self.ivf_nlist,
+        )
+        blocks = range(0, n, _ADD_BLOCK)
+        thresholds = None
+        if self.quantization == "binary":
+            total = np.zeros(self.dim, dtype=np.float64)
+            for start in blocks:
+                total += vectors[start:start + _ADD_BLOCK].sum(axis=0)
+            thresholds = (total / n).astype(np.float32)
+            self._params["thresholds"] = thresholds.tolist()
+        elif not self._index.is_trained:
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(n, size=min(n, self.train_size), replace=False))
+            self._index.train(np.ascontiguousarray(vectors[sample]))
+        for start in blocks:
+            block = np.ascontiguousarray(vectors[start:start + _ADD_BLOCK])
+            self._index.add(binarize(block, thresholds) if thresholds is not None else block)
+
+    def commit(self, embedding: Optional[dict] = None) -> dict:
+        """Finish the index and move every file into place.
+
+        Args:
+            embedding: ``model`` / ``normalize`` settings queries must match.
+
+        Returns:
+            The index build parameters recorded in ``store.json``.
+        """
+        if not self.count:
+            raise ValueError("No documents were added to the index.")
+        self._text.close()
+        self._spool.close()
+        spooled = np.memmap(
+            self._tmp(VECTORS_SPOOL), dtype=np.float32, mode="r", shape=(self.count, self.dim)
+        )
+        if self._index is None:
+            self._build_from_spool(spooled)
+
+        with open(self._tmp(CHUNKS_FILE), "wb") as f:
+            np.save(f, np.concatenate(self._records))
+        self._write_bm25()
+        if isinstance(self._index, faiss.IndexBinary):
+            faiss.write_index_binary(self._index, self._tmp(INDEX_FILE))
+        else:
+            faiss.write_index(self._index, self._tmp(INDEX_FILE))
+
+        # Only compressed codes need the float vectors beside them for
+        # re-scoring; other indexes can reconstruct them (see load_vectors)
+        files = [TEXT_FILE, CHUNKS_FILE, BM25_FILE, INDEX_FILE]
+        if self.quantization != "none":
+            # vectors.npy = .npy header + the spooled rows, copied block by block
+            with open(self._tmp(VECTORS_FILE), "wb") as f:
+                np.lib.format.write_array_header_1_0(
+                    f, {"descr": "<f4", "fortran_order": False, "shape": (self.count, self.dim)}
+                )
+                for start in range(0, self.count, _ADD_BLOCK):
+                    f.write(spooled[start:start + _ADD_BLOCK].tobytes())
+            files.append(VECTORS_FILE)
+        del spooled
+        os.remove(self._tmp(VECTORS_SPOOL))
+
+        with open(self._tmp(STORE_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "format": FORMAT_VERSION,
+                    "count": self.count,
+                    "dim": self.dim,
+                    "embedding": embedding or {"model": None, "normalize": False},
+                    "index": self._params,
+                    "metadata_keys": list(METADATA_KEYS),
+                    "strings": self._strings,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        total = self._text_offset + self._text_shared
+        log.info(
+            "%s: %.1f MB (%.0f%% of chunk text shared between overlapping chunks)",
+            TEXT_FILE, self._text_offset / 1e6, 100 * self._text_shared / max(total, 1),
+        )
+        # store.json last: readers detect the format by this file
+        for name in files + [STORE_FILE]:
+            os.replace(self._tmp(name), os.path.join(self.index_dir, name))
+        self._closed = True
+
+        # A stale pickle docstore or vector copy would still ship to the Space
+        stale = [LEGACY_DOCSTORE_FILE] + ([VECTORS_FILE] if VECTORS_FILE not in files else [])
+        for name in stale:
+            path = os.path.join(self.index_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+                log.info("Removed stale %s from %s/", name, self.index_dir)
+        return self._params
+
+    def abort(self) -> None:
+        """Discard everything written so far."""
+        self._text.close()
+        self._spool.close()
+        for name in (
+            TEXT_FILE, VECTORS_SPOOL, CHUNKS_FILE, BM25_FILE, INDEX_FILE, VECTORS_FILE, STORE_FILE
+        ):
+            if os.path.exists(self._tmp(name)):
+                os.remove(self._tmp(name))
+        self._closed = True
+
+
+# ── Reading ───────────────────────────────────────────────────────────────
+
+class ChunkStore(Docstore):
+    """Read-only docstore over ``text.bin`` + ``chunks.npy``.
+
+    Document ids are row numbers (as strings, per the ``Docstore`` API);
+    text and metadata are materialised only when a row is requested.
+    """
+
+    def __init__(self, index_dir: str) -> None:
+        info = read_store_info(index_dir)
+        self._keys: list[str] = info["metadata_keys"]
+        self._strings: list[str] = info["strings"]
+        self._records = np.load(os.path.join(index_dir, CHUNKS_FILE), mmap_mode="r")
+        text_path = os.path.join(index_dir, TEXT_FILE)
+        if os.path.getsize(text_path):
+            with open(text_path, "rb") as f:
+                self._text: Union[mmap.mmap, bytes] = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        else:
+            self._text = b""
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, i: int) -> Document:
+        """Materialise the document stored at row ``i``."""
+        record = self._records[i]
+        metadata = {
+            key: self._strings[record[key]] for key in self._keys if record[key] >= 0
+        }
+        text = self._text[int(record["start"]):int(record["end"])].decode("utf-8")
+        return Document(id=str(i), page_content=text, metadata=metadata)
+
+    def search(self, search: str) -> Union[str, Document]:
+        try:
+            i = int(search)
+        except ValueError:
+            return f"ID {search} not found."
+        if not 0 <= i < len(self):
+            return f"ID {search} not found."
+        return self.get(i)
+
+
+class _RowIds(Mapping[int, str]):
+    """``index_to_docstore_id`` for a :class:`ChunkStore`: row ``i`` -> ``"i"``."""
+
+    def __init__(self, count: int) -> None:
+        self._count = count
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < self._count:
+            raise KeyError(i)
+        return str(i)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self._count))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def _read_index(
+    index_dir: str,
+    ef_search: Optional[int],
+    nprobe: Optional[int],
+    rerank_factor: int,
+) -> Union[faiss.Index, RescoringIndex]:
+    """Open the (memory-mapped) FAISS index of a compact index directory."""
+    params = read_store_info(index_dir)["index"]
+    quantization = params.get("quantization", "none")
+    path = os.path.join(index_dir, INDEX_FILE)
+    if quantization == "binary":
+        index = faiss.read_index_binary(path, _MMAP_FLAGS)
+    else:
+        index = faiss.read_index(path, _MMAP_FLAGS)
+        set_search_params(index, ef_search=ef_search, nprobe=nprobe)
+    if quantization != "none":
+        thresholds = params.get("thresholds")
+        index = RescoringIndex(
+            index,
+            np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r"),
+            rerank_factor,
+            np.asarray(thresholds, dtype=np.float32) if thresholds else None,
+        )
+    return index
+
+
+def open_index(
+    index_dir: str,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    rerank_factor: int = 4,
+) -> tuple[Union[faiss.Index, RescoringIndex], Callable[[int], Document]]:
+    """Open an index for direct ``search`` calls, without a LangChain wrapper.
+
+    Returns the index and a row -> ``Document`` lookup: :meth:`ChunkStore.get`
+    for compact indexes, or a list of the pickled documents in row order for
+    legacy ones. Either way ``Document.id`` is the row number. Search knobs
+    are the same as for :func:`load_vectorstore`.
+    """
+    if is_compact_index(index_dir):
+        index = _read_index(index_dir, ef_search, nprobe, rerank_factor)
+        return index, ChunkStore(index_dir).get
+
+    index = faiss.read_index(os.path.join(index_dir, INDEX_FILE))
+    set_search_params(index, ef_search=ef_search, nprobe=nprobe)
+    # Same trust model as FAISS.load_local(allow_dangerous_deserialization=True)
+    with open(os.path.join(index_dir, LEGACY_DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    documents = []
+    for i in range(index.ntotal):
+        doc = docstore.search(index_to_docstore_id[i])
+        documents.append(Document(id=str(i), page_content=doc.page_content, metadata=doc.metadata))
+    return index, documents.__getitem__
+
+
+def load_vectorstore(
+    index_dir: str,
+    embeddings: Embeddings,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    rerank_factor: int = 4,
+) -> FAISS:
+    """Load a compact index (mmap) or fall back to a LangChain pickle index.
+
+    ``ef_search`` / ``nprobe`` tune HNSW / IVF indexes and are ignored for
+    flat ones; ``rerank_factor`` sets the candidate pool of quantized ones.
+    """
+    if not is_compact_index(index_dir):
+        return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+
+    store = ChunkStore(index_dir)
+    return FAISS(
+        embedding_function=embeddings,
+        index=_read_index(index_dir, ef_search, nprobe, rerank_factor),
+        docstore=store,
+        index_to_docstore_id=_RowIds(len(store)),
+    )
@@ -1,27 +1,100 @@
 """Unified PDF → FAISS indexing pipeline for all three Tolkien books.
 
+Pages stream through splitting, chapter tagging and embedding in fixed-size
+batches into the compact, memory-mappable index format described in
+``index_store.py``.
+
 Usage:
     python indexer.py              # Index all three books
     python indexer.py --book hobbit # Index only The Hobbit
+    python indexer.py --book hobbit --incremental     # Re-embed The Hobbit only if
+                                                      # changed; keep the other books
+    python indexer.py --index-type hnsw --hnsw-m 32   # Approximate search
+    python indexer.py --quantization int8             # Compressed vectors
+    python indexer.py --jobs 3                        # Parse books with 3 processes
+    python indexer.py --multi-process --batch-size 128 # Embed on every CPU core
+    python indexer.py --no-embed-cache                 # Re-embed every chunk
+    python indexer.py --no-dedup                       # Keep headers and duplicate chunks
+    python indexer.py --split-mode sentence            # Sentence chunks within chapters
 """
 
 from __future__ import annotations
 
 import argparse
+import gzip
+import hashlib
+import json
 import logging
 import os
 import re
+import shutil
+import tempfile
+import time
 import warnings
+import zlib
+from bisect import bisect_right
+from collections import Counter, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+from importlib import metadata
+from itertools import islice
 from typing import Optional
 
+import numpy as np
 from dotenv import load_dotenv
-from langchain.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
+from pypdf import PdfReader
+from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer
 
-from config import CHUNK_OVERLAP, CHUNK_SIZE, EMBEDDING_MODEL, FAISS_INDEX_DIR
+from cache import EmbeddingCache
+from config import (
+    BOILERPLATE_MIN_PAGES,
+    CHUNK_OVERLAP,
+    CHUNK_OVERLAP_TOKENS,
+    CHUNK_SIZE,
+    CHUNK_TOKENS,
+    DEDUP_ENABLED,
+    EMBED_BATCH_SIZE,
+    EMBED_CACHE_PATH,
+    EMBED_MULTI_PROCESS,
+    EMBED_NORMALIZE,
+    EMBEDDING_MODEL,
+    FAISS_INDEX_DIR,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_M,
+    INDEX_JOBS,
+    INDEX_TYPE,
+    IVF_NLIST,
+    NEAR_DUPLICATE_THRESHOLD,
+    PAGE_CACHE_DIR,
+    PIPELINE_BATCH_SIZE,
+    QUANTIZATION,
+    SPLIT_MODE,
+)
+from index_store import (
+    BM25_FILE,
+    CHUNKS_FILE,
+    INDEX_FILE,
+    INDEX_TYPES,
+    LEGACY_DOCSTORE_FILE,
+    QUANTIZATIONS,
+    STORE_FILE,
+    TEXT_FILE,
+    VECTORS_FILE,
+    ChunkStore,
+    IndexWriter,
+    embedding_settings,
+    is_compact_index,
+    load_vectors,
+    read_shards,
+    read_store_info,
+    shard_slug,
+    write_shards,
+)
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
@@ -29,11 +102,18 @@ log = logging.getLogger(__name__)
 
 # ── Text splitter (shared) ────────────────────────────────────────────────
 splitter = RecursiveCharacterTextSplitter(
-    chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+    chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
 )
 
 # ── Book metadata ─────────────────────────────────────────────────────────
 
+# Source PDF for each book key (relative to books_dir)
+BOOK_FILES: dict[str, str] = {
+    "hobbit": "The Hobbit.pdf",
+    "lotr": "The Lord of The Rings.pdf",
+    "silmarillion": "The Silmarillion.pdf",
+}
+
 # LOTR sub-book detection
 LOTR_BOOK_SECTIONS: dict[str, str] = {
     "THE FELLOWSHIP OF THE RING": "The Fellowship of the Ring",
@@ -97,125 +177,564 @@ SILMARILLION_CHAPTERS: set[str] = {
 }
 
 
-# ── Per-book indexing functions ───────────────────────────────────────────
+# ── PDF extraction ────────────────────────────────────────────────────────
 
-def _load_and_split(pdf_path: str) -> list[Document]:
-    loader = PyPDFLoader(pdf_path)
-    return splitter.split_documents(loader.load())
+PAGE_CACHE_VERSION = 3  # bump when page extraction or the cache format changes
+MIN_PAGES_PER_RANGE = 8  # smaller ranges cost more in re-opening the PDF
 
 
-def index_hobbit(books_dir: str = "books") -> list[Document]:
-    """Index The Hobbit with chapter-level metadata."""
-    path = os.path.join(books_dir, "The Hobbit.pdf")
-    chunks = _load_and_split(path)
-    docs: list[Document] = []
+def _extractor_version() -> str:
+    """Identify the text extractor, so a pypdf upgrade invalidates cached pages and vectors."""
+    try:
+        pypdf_version = metadata.version("pypdf")
+    except metadata.PackageNotFoundError:
+        pypdf_version = "unknown"
+    return f"pypdf-{pypdf_version}-v{PAGE_CACHE_VERSION}"
 
-    last_chapter_number = "Unknown"
-    last_chapter_name = "Unknown"
 
-    for chunk in chunks:
-        lines = chunk.page_content.splitlines()
-        chapter_number = "Unknown"
-        chapter_name = "Unknown"
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> list[str]:
+    """Extract the text of pages ``[start, stop)`` (runs in a worker process)."""
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
 
-        for i, line in enumerate(lines):
-            match = re.match(r"(?i)^chapter\s+([ivxlcdm\d]+)", line.strip())
-            if match:
-                chapter_number = f"Chapter {match.group(1).upper()}"
-                for j in range(i + 1, min(i + 6, len(lines))):
-                    next_line = lines[j].strip()
-                    if next_line and not next_line.lower().startswith("chapter"):
-                        chapter_name = next_line.title() if next_line.isupper() else next_line
+
+def _extract_pages(pdf_path: str, jobs: int = INDEX_JOBS) -> Iterator[str]:
+    """Yield every page's text, splitting the PDF into page ranges.
+
+    Ranges are handed to ``jobs`` worker processes and yielded in page
+    order, so the result is identical to a sequential read. Only a few
+    ranges per worker are in flight at once, keeping memory bounded.
+    """
+    num_pages = len(PdfReader(pdf_path).pages)
+    jobs = min(jobs or os.cpu_count() or 1, max(1, num_pages // MIN_PAGES_PER_RANGE))
+    if jobs <= 1:
+        for start in range(0, num_pages, MIN_PAGES_PER_RANGE):
+            yield from _extract_page_range(
+                pdf_path, start, min(start + MIN_PAGES_PER_RANGE, num_pages)
+            )
+        return
+
+    # A few ranges per worker evens out pages that are slow to decode
+    step = max(MIN_PAGES_PER_RANGE, -(-num_pages // (jobs * 4)))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending: deque = deque()
+        for start in range(0, num_pages, step):
+            pending.append(
+                pool.submit(_extract_page_range, pdf_path, start, min(start + step, num_pages))
+            )
+            if len(pending) > 2 * jobs:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _load_pages(
+    pdf_path: str,
+    jobs: int = INDEX_JOBS,
+    cache_dir: str = PAGE_CACHE_DIR,
+) -> Iterator[Document]:
+    """Yield one Document per PDF page, reusing cached text when possible.
+
+    Page text is stored as gzip-compressed JSON lines under ``cache_dir``,
+    keyed by the PDF's SHA-256 and the extractor version, so re-chunking
+    with different splitter settings or chapter rules never re-parses an
+    unchanged PDF. An empty ``cache_dir`` disables the cache.
+    """
+    name = os.path.basename(pdf_path)
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(
+            cache_dir, f"{_file_sha256(pdf_path)}.{_extractor_version()}.jsonl.gz"
+        )
+
+    if cache_path and os.path.exists(cache_path):
+        log.info("Reading cached pages for %s", name)
+        with gzip.open(cache_path, "rt", encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                yield Document(page_content=json.loads(line), metadata={"source": pdf_path, "page": i})
+        return
+
+    start = time.perf_counter()
+    out = None
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        out = gzip.open(tmp_path, "wt", encoding="utf-8")
+    finished = False
+    try:
+        i = -1
+        for i, text in enumerate(_extract_pages(pdf_path, jobs)):
+            if out is not None:
+                out.write(json.dumps(text, ensure_ascii=False) + "\n")
+            yield Document(page_content=text, metadata={"source": pdf_path, "page": i})
+        finished = True
+    finally:
+        if out is not None:
+            out.close()
+            # Only a fully extracted PDF is cached; drop a partial one
+            if not finished:
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+    if out is not None:
+        os.replace(tmp_path, cache_path)
+    log.info("Extracted %d pages from %s in %.1fs", i + 1, name, time.perf_counter() - start)
+
+
+# ── Chapter boundaries ────────────────────────────────────────────────────
+
+def _normalize_title(text: str) -> str:
+    """Canonical form for heading lookups: collapsed whitespace, casefolded."""
+    return " ".join(text.split()).casefold()
+
+
+HOBBIT_CHAPTER_PATTERN = re.compile(r"(?i)^chapter\s+([ivxlcdm\d]+)")
+LOTR_SECTION_PATTERN = re.compile("|".join(map(re.escape, LOTR_BOOK_SECTIONS)))
+
+# Normalized title -> (sub-book, canonical title)
+LOTR_CHAPTER_LOOKUP: dict[str, tuple[str, str]] = {
+    _normalize_title(title): (book, title)
+    for book, titles in LOTR_CHAPTERS.items()
+    for title in titles
+}
+SILMARILLION_CHAPTER_LOOKUP: dict[str, str] = {
+    _normalize_title(title): title for title in SILMARILLION_CHAPTERS
+}
+
+
+class ChapterMap:
+    """Chapter (and sub-book) metadata spans keyed by character offset.
+
+    Offsets count characters across all pages of a book. Each boundary
+    starts a span whose metadata holds until the next boundary, so a
+    chunk is tagged with a binary search on its offset.
+
+    Args:
+        initial: Metadata in effect before the first boundary.
+    """
+
+    def __init__(self, initial: dict[str, str]) -> None:
+        self._offsets: list[int] = [0]
+        self._spans: list[dict[str, str]] = [dict(initial)]
+
+    @property
+    def current(self) -> dict[str, str]:
+        """Metadata of the last span found so far."""
+        return self._spans[-1]
+
+    def add(self, offset: int, update: dict[str, str]) -> bool:
+        """Start a new span at ``offset`` with ``update`` applied.
+
+        Returns:
+            True if the metadata changed (a real boundary), else False.
+        """
+        span = {**self.current, **update}
+        if span == self.current:
+            return False
+        self._offsets.append(offset)
+        self._spans.append(span)
+        return True
+
+    def at(self, offset: int) -> dict[str, str]:
+        """Metadata of the span containing ``offset``."""
+        return self._spans[bisect_right(self._offsets, offset) - 1]
+
+
+def _detect_hobbit(lines: list[str], i: int, current: dict[str, str]) -> Optional[dict]:
+    match = HOBBIT_CHAPTER_PATTERN.match(lines[i].strip())
+    if not match:
+        return None
+    chapter_name = "Unknown"
+    for j in range(i + 1, min(i + 6, len(lines))):
+        next_line = lines[j].strip()
+        if next_line and not next_line.lower().startswith("chapter"):
+            chapter_name = next_line.title() if next_line.isupper() else next_line
+            break
+    return {"chapter_number": f"Chapter {match.group(1).upper()}", "chapter_name": chapter_name}
+
+
+def _detect_lotr(lines: list[str], i: int, current: dict[str, str]) -> Optional[dict]:
+    clean = lines[i].strip()
+    update: dict[str, str] = {}
+    sections = LOTR_SECTION_PATTERN.findall(clean.upper())
+    if sections:
+        update["book_name"] = LOTR_BOOK_SECTIONS[sections[-1]]
+    entry = LOTR_CHAPTER_LOOKUP.get(_normalize_title(clean))
+    if entry and entry[0] == update.get("book_name", current["book_name"]):
+        update["chapter_name"] = entry[1]
+    return update or None
+
+
+def _detect_silmarillion(lines: list[str], i: int, current: dict[str, str]) -> Optional[dict]:
+    title = SILMARILLION_CHAPTER_LOOKUP.get(_normalize_title(lines[i]))
+    return {"chapter_name": title} if title else None
+
+
+# ── Sentence-aware splitting ──────────────────────────────────────────────
+
+SPLIT_MODES: tuple[str, ...] = ("recursive", "sentence")
+
+# Sentence end: terminal punctuation plus closing quotes/brackets, then space
+SENTENCE_END_PATTERN = re.compile(r"[.!?…]+[\"'”’)\]]*(?=\s)")
+ABBREVIATIONS: set[str] = {"mr", "mrs", "dr", "st", "mt", "no"}
+
+
+@lru_cache(maxsize=1)
+def _token_counter() -> Callable[[list[str]], list[int]]:
+    """Count tokens with the embedding model's own tokenizer."""
+    tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+
+    def count(texts: list[str]) -> list[int]:
+        if not texts:
+            return []
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    return count
+
+
+def _split_sentences(text: str) -> tuple[list[str], str]:
+    """Split ``text`` into whole sentences plus the unfinished remainder.
+
+    Line breaks inside a sentence (PDF layout) are collapsed to spaces.
+    """
+    sentences: list[str] = []
+    start = 0
+    for match in SENTENCE_END_PATTERN.finditer(text):
+        words = text[start:match.start()].split()
+        if match.group() == "." and words and words[-1].casefold() in ABBREVIATIONS:
+            continue
+        sentence = " ".join(text[start:match.end()].split())
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    return sentences, text[start:]
+
+
+class SentenceChunker:
+    """Pack whole sentences into chunks of at most ``max_tokens`` tokens.
+
+    Text is fed in order together with the chapter metadata it belongs to;
+    when the metadata changes the current chunk is closed, so no chunk ever
+    crosses a chapter boundary. Consecutive chunks of a chapter overlap by
+    whole sentences (up to ``overlap_tokens``) rather than by a fixed
+    character count. A single sentence longer than the budget is split on
+    clause and word boundaries.
+
+    Args:
+        count_tokens: Token counts for a batch of texts.
+        max_tokens: Chunk budget in embedding-model tokens.
+        overlap_tokens: Budget for sentences repeated from the previous chunk.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[list[str]], list[int]],
+        max_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    ) -> None:
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self._long_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=max_tokens,
+            chunk_overlap=0,
+            length_function=lambda text: count_tokens([text])[0],
+            separators=["; ", ", ", " ", ""],
+        )
+        self._metadata: Optional[dict[str, str]] = None
+        self._remainder = ""
+        self._sentences: list[tuple[str, int]] = []
+        self._tokens = 0
+        self._fresh = 0  # sentences added since the last emitted chunk
+
+    def feed(self, text: str, metadata: dict[str, str]) -> Iterator[tuple[str, dict[str, str]]]:
+        """Add ``text`` from the span ``metadata``; yield every completed chunk."""
+        if metadata is not self._metadata:
+            yield from self.flush()
+            self._metadata = metadata
+        # Pages are fed one by one: keep the last word of one page apart
+        # from the first word of the next
+        joined = f"{self._remainder}\n{text}" if self._remainder else text
+        sentences, self._remainder = _split_sentences(joined)
+        if len(self._remainder) > 8 * self.max_tokens:
+            # Verse or lists without punctuation: stop waiting for a full stop
+            sentences.append(" ".join(self._remainder.split()))
+            self._remainder = ""
+        yield from self._pack(sentences)
+
+    def flush(self) -> Iterator[tuple[str, dict[str, str]]]:
+        """Close the current chapter: emit what is left, without overlap."""
+        sentence = " ".join(self._remainder.split())
+        self._remainder = ""
+        yield from self._pack([sentence] if sentence else [])
+        if self._fresh:
+            yield self._chunk()
+        self._sentences, self._tokens, self._fresh = [], 0, 0
+
+    def _chunk(self) -> tuple[str, dict[str, str]]:
+        return " ".join(sentence for sentence, _ in self._sentences), self._metadata
+
+    def _pack(self, sentences: list[str]) -> Iterator[tuple[str, dict[str, str]]]:
+        for sentence, tokens in zip(sentences, self.count_tokens(sentences)):
+            if tokens > self.max_tokens:
+                if self._fresh:
+                    yield self._chunk()
+                self._sentences, self._tokens, self._fresh = [], 0, 0
+                for piece in self._long_splitter.split_text(sentence):
+                    yield piece, self._metadata
+                continue
+            if self._tokens + tokens > self.max_tokens:
+                if self._fresh:
+                    yield self._chunk()
+                # Carry whole trailing sentences over as the overlap
+                overlap: list[tuple[str, int]] = []
+                budget = min(self.overlap_tokens, self.max_tokens - tokens)
+                for previous in reversed(self._sentences):
+                    if previous[1] > budget:
                         break
-                last_chapter_number = chapter_number
-                last_chapter_name = chapter_name
-                break
+                    overlap.insert(0, previous)
+                    budget -= previous[1]
+                self._sentences = overlap
+                self._tokens = sum(n for _, n in overlap)
+                self._fresh = 0
+            self._sentences.append((sentence, tokens))
+            self._tokens += tokens
+            self._fresh += 1
+
+
+# ── Boilerplate and near-duplicate removal ───────────────────────────────
 
-        if chapter_number == "Unknown":
-            chapter_number = last_chapter_number
-            chapter_name = last_chapter_name
+EDGE_LINES = 2  # non-empty lines at each end of a page checked for headers/footers
+MAX_BOILERPLATE_LEN = 80  # longer lines are prose, never running headers
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16  # LSH bands of MINHASH_PERMUTATIONS // MINHASH_BANDS rows
+SHINGLE_WORDS = 5
+_MINHASH_PRIME = (1 << 31) - 1
 
-        docs.append(Document(
-            page_content=chunk.page_content,
-            metadata={
-                "book_name": "The Hobbit",
-                "chapter_number": chapter_number,
-                "chapter_name": chapter_name,
-            },
-        ))
 
-    log.info("The Hobbit: %d chunks", len(docs))
-    return docs
+def _edge_line_indices(lines: list[str]) -> list[int]:
+    """Indices of the first and last ``EDGE_LINES`` non-empty lines of a page."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return sorted(set(filled[:EDGE_LINES] + filled[-EDGE_LINES:]))
 
 
-def index_lotr(books_dir: str = "books") -> list[Document]:
-    """Index The Lord of the Rings with book/chapter metadata."""
-    path = os.path.join(books_dir, "The Lord of The Rings.pdf")
-    chunks = _load_and_split(path)
-    docs: list[Document] = []
+def _edge_key(line: str) -> Optional[str]:
+    """Normalized header/footer candidate (page numbers become ``#``), if short."""
+    key = re.sub(r"\d+", "#", " ".join(line.split())).casefold()
+    return key if key and len(key) <= MAX_BOILERPLATE_LEN else None
 
-    current_book = "The Fellowship of the Ring"
-    current_chapter = "Unknown"
 
-    for chunk in chunks:
-        lines = chunk.page_content.splitlines()
+def _boilerplate_lines(pages: Iterable[Document], min_pages: int) -> set[str]:
+    """Edge-line keys that recur on at least ``min_pages`` of ``pages``."""
+    counts: Counter[str] = Counter()
+    for page in pages:
+        lines = page.page_content.splitlines()
+        keys = {_edge_key(lines[i]) for i in _edge_line_indices(lines)}
+        counts.update(key for key in keys if key)
+    return {key for key, count in counts.items() if count >= min_pages}
 
-        for line in lines:
-            clean = line.strip()
-            upper = clean.upper()
 
-            for key, val in LOTR_BOOK_SECTIONS.items():
-                if key in upper:
-                    current_book = val
+class NearDuplicateFilter:
+    """MinHash/LSH detector of chunks that repeat earlier text.
 
-            for title in LOTR_CHAPTERS.get(current_book, set()):
-                if clean.lower() == title.lower():
-                    current_chapter = title
-                    break
+    Chunks are shingled into word 5-grams (hashed with CRC-32, so results
+    are stable across runs) and summarised by a MinHash signature. LSH
+    banding finds earlier chunks that may be similar; a chunk is a
+    duplicate if its estimated Jaccard similarity to one of them reaches
+    ``threshold``.
+
+    Args:
+        threshold: Estimated Jaccard similarity at which a chunk is dropped.
+    """
+
+    def __init__(self, threshold: float) -> None:
+        self.threshold = threshold
+        rng = np.random.default_rng(0)
+        self._a = rng.integers(1, _MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+        self._b = rng.integers(0, _MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+        self._rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+        self._buckets: list[dict[bytes, list[int]]] = [{} for _ in range(MINHASH_BANDS)]
+        self._signatures: list[np.ndarray] = []
+
+    def _signature(self, text: str) -> np.ndarray:
+        words = text.casefold().split()
+        shingles = {
+            " ".join(words[i:i + SHINGLE_WORDS])
+            for i in range(max(1, len(words) - SHINGLE_WORDS + 1))
+        }
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MINHASH_PRIME
+        return permuted.min(axis=1)
+
+    def is_duplicate(self, text: str) -> bool:
+        """True if ``text`` nearly repeats an earlier chunk; otherwise remember it."""
+        signature = self._signature(text)
+        keys = [
+            signature[band * self._rows:(band + 1) * self._rows].tobytes()
+            for band in range(MINHASH_BANDS)
+        ]
+        candidates = {i for band, key in enumerate(keys) for i in self._buckets[band].get(key, ())}
+        for i in candidates:
+            if np.mean(self._signatures[i] == signature) >= self.threshold:
+                return True
+        chunk_id = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(chunk_id)
+        return False
 
-        docs.append(Document(
-            page_content=chunk.page_content,
-            metadata={
-                "book_name": current_book,
-                "chapter_name": current_chapter,
-            },
-        ))
 
-    log.info("The Lord of the Rings: %d chunks", len(docs))
-    return docs
+def _tag_chunks(
+    pdf_path: str,
+    jobs: int,
+    detect: Callable[[list[str], int, dict[str, str]], Optional[dict]],
+    initial: dict[str, str],
+    dedup: bool = DEDUP_ENABLED,
+    split_mode: str = SPLIT_MODE,
+) -> Iterator[Document]:
+    """Split a PDF into chunks tagged with chapter metadata.
 
+    Each page's lines are scanned once by ``detect`` (which returns a
+    metadata update for a heading line, else ``None``) before the page is
+    split. In ``recursive`` mode each page is cut into ``CHUNK_SIZE``
+    characters and every chunk takes the span covering its midpoint, i.e.
+    the chapter most of its text belongs to. In ``sentence`` mode a
+    :class:`SentenceChunker` packs whole sentences across pages and closes
+    its chunk at every chapter boundary.
 
-def index_silmarillion(books_dir: str = "books") -> list[Document]:
-    """Index The Silmarillion with chapter metadata."""
-    path = os.path.join(books_dir, "The Silmarillion.pdf")
-    chunks = _load_and_split(path)
-    docs: list[Document] = []
+    With ``dedup``, running headers/footers (edge lines recurring on at
+    least ``BOILERPLATE_MIN_PAGES`` pages) are cut from each page before
+    splitting, and chunks that nearly repeat an earlier chunk of the book
+    are dropped before they reach the embedder. Headings are still detected
+    on the full page, so running headers keep driving chapter tags.
+    """
+    if split_mode not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode: {split_mode} (expected one of {SPLIT_MODES})")
+    name = os.path.basename(pdf_path)
+    pages: Iterable[Document] = _load_pages(pdf_path, jobs, PAGE_CACHE_DIR)
+    boilerplate: set[str] = set()
+    if dedup:
+        # Boilerplate is known only after every page is seen. The first pass
+        # fills the page cache, so the second streams it back instead of
+        # re-parsing the PDF; without a cache the pages are kept in memory.
+        if not PAGE_CACHE_DIR:
+            pages = list(pages)
+        boilerplate = _boilerplate_lines(pages, BOILERPLATE_MIN_PAGES)
+        if PAGE_CACHE_DIR:
+            pages = _load_pages(pdf_path, jobs, PAGE_CACHE_DIR)
+    near_duplicates = NearDuplicateFilter(NEAR_DUPLICATE_THRESHOLD) if dedup else None
+    sentences = SentenceChunker(_token_counter()) if split_mode == "sentence" else None
+    stripped: Counter[str] = Counter()
+    dropped = 0
+
+    def emit(chunks: Iterable[tuple[str, dict[str, str]]]) -> Iterator[Document]:
+        nonlocal dropped
+        for content, metadata in chunks:
+            if near_duplicates is not None and near_duplicates.is_duplicate(content):
+                dropped += 1
+                log.debug("%s: dropped near-duplicate chunk %r", name, content[:80])
+                continue
+            yield Document(page_content=content, metadata=dict(metadata))
 
-    current_chapter = "Unknown"
+    chapters = ChapterMap(initial)
+    base = 0
+    for page in pages:
+        lines = page.page_content.splitlines(keepends=True)
+        strip = {i for i in _edge_line_indices(lines) if _edge_key(lines[i]) in boilerplate}
+        kept: list[str] = []
+        spans = [(0, chapters.current)]  # (offset in page text, metadata from there on)
+        offset = base
+        for i, line in enumerate(lines):
+            update = detect(lines, i, chapters.current)
+            if update and chapters.add(offset, update):
+                spans.append((offset - base, chapters.current))
+            if i in strip:
+                stripped[_edge_key(line)] += 1
+                continue
+            kept.append(line)
+            offset += len(line)
+        text = "".join(kept)
 
-    for chunk in chunks:
-        lines = chunk.page_content.splitlines()
+        if sentences is None:
+            yield from emit(
+                (chunk.page_content, chapters.at(
+                    base + chunk.metadata["start_index"] + len(chunk.page_content) // 2
+                ))
+                for chunk in splitter.create_documents([text])
+            )
+        else:
+            ends = [start for start, _ in spans[1:]] + [len(text)]
+            for (start, metadata), end in zip(spans, ends):
+                yield from emit(sentences.feed(text[start:end], metadata))
+        base += len(text)
+    if sentences is not None:
+        yield from emit(sentences.flush())
 
-        for line in lines:
-            clean = line.strip()
-            for title in SILMARILLION_CHAPTERS:
-                if clean.lower() == title.lower():
-                    current_chapter = title
-                    break
+    if dedup:
+        log.info(
+            "%s: stripped %d header/footer lines, dropped %d near-duplicate chunks",
+            name, sum(stripped.values()), dropped,
+        )
+        for key, count in stripped.most_common(5):
+            log.info("  %4d × %r", count, key)
 
-        docs.append(Document(
-            page_content=chunk.page_content,
-            metadata={
-                "book_name": "The Silmarillion",
-                "chapter_name": current_chapter,
-            },
-        ))
 
-    log.info("The Silmarillion: %d chunks", len(docs))
-    return docs
+# ── Per-book indexing functions ───────────────────────────────────────────
 
+def index_hobbit(
+    books_dir: str = "books",
+    extract_jobs: int = INDEX_JOBS,
+    dedup: bool = DEDUP_ENABLED,
+    split_mode: str = SPLIT_MODE,
+) -> Iterator[Document]:
+    """Index The Hobbit with chapter-level metadata, one chunk at a time."""
+    path = os.path.join(books_dir, BOOK_FILES["hobbit"])
+    initial = {"book_name": "The Hobbit", "chapter_number": "Unknown", "chapter_name": "Unknown"}
+    count = 0
+    for doc in _tag_chunks(path, extract_jobs, _detect_hobbit, initial, dedup, split_mode):
+        count += 1
+        yield doc
+    log.info("The Hobbit: %d chunks", count)
 
-# ── Main entry point ─────────────────────────────────────────────────────
+
+def index_lotr(
+    books_dir: str = "books",
+    extract_jobs: int = INDEX_JOBS,
+    dedup: bool = DEDUP_ENABLED,
+    split_mode: str = SPLIT_MODE,
+) -> Iterator[Document]:
+    """Index The Lord of the Rings with book/chapter metadata, one chunk at a time."""
+    path = os.path.join(books_dir, BOOK_FILES["lotr"])
+    initial = {"book_name": "The Fellowship of the Ring", "chapter_name": "Unknown"}
+    count = 0
+    for doc in _tag_chunks(path, extract_jobs, _detect_lotr, initial, dedup, split_mode):
+        count += 1
+        yield doc
+    log.info("The Lord of the Rings: %d chunks", count)
+
+
+def index_silmarillion(
+    books_dir: str = "books",
+    extract_jobs: int = INDEX_JOBS,
+    dedup: bool = DEDUP_ENABLED,
+    split_mode: str = SPLIT_MODE,
+) -> Iterator[Document]:
+    """Index The Silmarillion with chapter metadata, one chunk at a time."""
+    path = os.path.join(books_dir, BOOK_FILES["silmarillion"])
+    initial = {"book_name": "The Silmarillion", "chapter_name": "Unknown"}
+    count = 0
+    for doc in _tag_chunks(path, extract_jobs, _detect_silmarillion, initial, dedup, split_mode):
+        count += 1
+        yield doc
+    log.info("The Silmarillion: %d chunks", count)
+
+
+# ── Book registry ─────────────────────────────────────────────────────────
 
 BOOK_INDEXERS = {
     "hobbit": index_hobbit,
@@ -224,38 +743,486 @@ BOOK_INDEXERS = {
 }
 
 
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    """Group ``items`` into lists of at most ``size``."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _spool_book(
+    key: str, spool_path: str, books_dir: str, extract_jobs: int, dedup: bool, split_mode: str
+) -> str:
+    """Chunk one book into a gzip JSON-lines spool file (runs in a worker process)."""
+    with gzip.open(spool_path, "wt", encoding="utf-8") as out:
+        for doc in BOOK_INDEXERS[key](books_dir, extract_jobs, dedup, split_mode):
+            out.write(json.dumps([doc.page_content, doc.metadata], ensure_ascii=False) + "\n")
+    return spool_path
+
+
+def _read_spool(future: Future) -> Iterator[Document]:
+    """Stream a spooled book's chunks once its worker has finished."""
+    spool_path = future.result()
+    try:
+        with gzip.open(spool_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                content, metadata = json.loads(line)
+                yield Document(page_content=content, metadata=metadata)
+    finally:
+        os.remove(spool_path)
+
+
+@contextmanager
+def _book_chunks(
+    keys: list[str], books_dir: str, jobs: int, dedup: bool, split_mode: str
+) -> Iterator[dict[str, Iterable[Document]]]:
+    """Chunk streams for ``keys``, with books parsed in parallel.
+
+    The ``jobs`` process budget (``0`` = one per CPU) is shared out: up to
+    one worker per book, each running its book's indexer with an equal
+    share of the PDF extraction processes and spooling the chunks to disk.
+    The caller embeds the books in order while later ones are still being
+    parsed; each stream waits for its own worker only. With a single
+    worker the books are chunked in-process, one after another.
+    """
+    budget = jobs or os.cpu_count() or 1
+    workers = min(budget, len(keys))
+    if workers <= 1:
+        yield {key: BOOK_INDEXERS[key](books_dir, jobs, dedup, split_mode) for key in keys}
+        return
+
+    extract_jobs = max(1, budget // workers)
+    log.info(
+        "Parsing %d books in %d worker processes (%d extraction processes each)",
+        len(keys), workers, extract_jobs,
+    )
+    with tempfile.TemporaryDirectory(prefix="gandalf-chunks-") as spool_dir:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                key: pool.submit(
+                    _spool_book, key, os.path.join(spool_dir, f"{key}.jsonl.gz"),
+                    books_dir, extract_jobs, dedup, split_mode,
+                )
+                for key in keys
+            }
+            yield {key: _read_spool(future) for key, future in futures.items()}
+
+
+# ── Manifest (incremental builds) ─────────────────────────────────────────
+
+MANIFEST_FILE = "manifest.json"
+
+# Bump when chunking or chapter detection changes, to force a re-embed
+INDEXER_VERSION = 5
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunking_params(normalize: bool, dedup: bool, split_mode: str) -> dict:
+    """Everything besides the PDF bytes that determines a book's vectors."""
+    if split_mode == "sentence":
+        split = {"mode": split_mode, "tokens": CHUNK_TOKENS, "overlap_tokens": CHUNK_OVERLAP_TOKENS}
+    else:
+        split = {"mode": split_mode, "size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP}
+    return {
+        "indexer_version": INDEXER_VERSION,
+        "extractor": _extractor_version(),
+        "split": split,
+        "embedding_model": EMBEDDING_MODEL,
+        "normalize": normalize,
+        "dedup": {
+            "boilerplate_min_pages": BOILERPLATE_MIN_PAGES,
+            "near_duplicate_threshold": NEAR_DUPLICATE_THRESHOLD,
+        } if dedup else None,
+    }
+
+
+def _read_manifest(output_dir: str) -> Optional[dict]:
+    """The previous build's manifest, if there is one."""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_manifest(output_dir: str, params: dict) -> Optional[dict]:
+    """Return the previous build's manifest if its vectors can be reused."""
+    manifest = _read_manifest(output_dir)
+    if manifest is None:
+        log.info("No reusable index in %s/ — building from scratch", output_dir)
+        return None
+    if manifest.get("params") != params:
+        log.info("Chunking/embedding parameters changed — re-embedding every book")
+        return None
+    shards = [name for book in manifest["books"].values() for name in book["shards"]]
+    if not all(is_compact_index(os.path.join(output_dir, shard_slug(name))) for name in shards):
+        log.info("Shards listed in %s are missing — building from scratch", MANIFEST_FILE)
+        return None
+    return manifest
+
+
+# ── Embedding ─────────────────────────────────────────────────────────────
+
+class Embedder:
+    """Embed chunk texts batch by batch with one loaded sentence-transformers model.
+
+    The model (and, with ``multi_process``, its pool of CPU workers) is
+    started on the first batch that misses ``cache`` and reused for every
+    later batch. Use as a context manager so the pool is shut down.
+
+    Args:
+        batch_size: Texts per model forward pass.
+        multi_process: Use sentence-transformers' multi-process encode pool.
+        normalize: Scale vectors to unit length.
+        cache: Content-addressed store of previously computed vectors.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = EMBED_BATCH_SIZE,
+        multi_process: bool = EMBED_MULTI_PROCESS,
+        normalize: bool = EMBED_NORMALIZE,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> None:
+        self.batch_size = batch_size
+        self.multi_process = multi_process
+        self.normalize = normalize
+        self.cache = cache
+        self.encoded = 0
+        self.seconds = 0.0
+        self._model: Optional[SentenceTransformer] = None
+        self._pool = None
+
+    def __enter__(self) -> "Embedder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._pool is not None:
+            self._model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        """Return ``(len(texts), dim)`` float32 vectors for ``texts``."""
+        # Match HuggingFaceEmbeddings, which the app uses to embed queries
+        texts = [text.replace("\n", " ") for text in texts]
+        cached = self.cache.get_many(texts) if self.cache is not None else {}
+        missing = [i for i in range(len(texts)) if i not in cached]
+
+        encoded = self._encode([texts[i] for i in missing]) if missing else None
+        dim = encoded.shape[1] if missing else len(next(iter(cached.values()), ()))
+        vectors = np.empty((len(texts), dim), dtype=np.float32)
+        for i, vector in cached.items():
+            vectors[i] = vector
+        if missing:
+            vectors[missing] = encoded
+        if self.normalize:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        if self._model is None:
+            self._model = SentenceTransformer(EMBEDDING_MODEL)
+            if self.multi_process:
+                self._pool = self._model.start_multi_process_pool()
+        start = time.perf_counter()
+        if self._pool is not None:
+            vectors = self._model.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+        else:
+            vectors = self._model.encode(texts, batch_size=self.batch_size)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        elapsed = time.perf_counter() - start
+        if self.cache is not None:
+            self.cache.put_many(texts, vectors, elapsed)
+        self.encoded += len(texts)
+        self.seconds += elapsed
+        log.info(
+            "Embedded %d chunks (%.1f chunks/s)",
+            self.encoded, self.encoded / max(self.seconds, 1e-9),
+        )
+        return vectors
+
+
+# ── Shards ────────────────────────────────────────────────────────────────
+
+def _writer(shard_dir: str, index_params: dict) -> IndexWriter:
+    return IndexWriter(
+        shard_dir,
+        index_type=index_params["index_type"],
+        quantization=index_params["quantization"],
+        hnsw_m=index_params["hnsw_m"],
+        hnsw_ef_construction=index_params["hnsw_ef_construction"],
+        ivf_nlist=index_params["ivf_nlist"],
+    )
+
+
+def _write_shards(
+    output_dir: str,
+    key: str,
+    docs: Iterable[Document],
+    embed: Embedder,
+    index_params: dict,
+    embedding: dict,
+    batch_size: int,
+) -> dict[str, int]:
+    """Embed one book's chunks into a shard per ``book_name``.
+
+    Returns:
+        Chunk count per shard name, in the order the shards were started.
+    """
+    counts: dict[str, int] = {}
+    with ExitStack() as stack:
+        writers: dict[str, IndexWriter] = {}
+        for batch in _batched(docs, batch_size):
+            vectors = embed([doc.page_content for doc in batch])
+            groups: dict[str, list[int]] = {}
+            for i, doc in enumerate(batch):
+                groups.setdefault(doc.metadata.get("book_name") or key, []).append(i)
+            for name, rows in groups.items():
+                if name not in writers:
+                    shard_dir = os.path.join(output_dir, shard_slug(name))
+                    writers[name] = stack.enter_context(_writer(shard_dir, index_params))
+                writers[name].add([batch[i] for i in rows], vectors[rows], source=key)
+        for name, writer in writers.items():
+            log.info("Shard '%s': %d chunks — finishing FAISS index...", name, writer.count)
+            writer.commit(embedding=embedding)
+            counts[name] = writer.count
+    return counts
+
+
+def _shard_is_current(shard_dir: str, index_params: dict) -> bool:
+    """True if a kept shard was built with ``index_params`` and has a keyword index."""
+    if not is_compact_index(shard_dir) or not os.path.exists(os.path.join(shard_dir, BM25_FILE)):
+        return False
+    built = read_store_info(shard_dir)["index"]
+    wanted = {"type": index_params["index_type"], "quantization": index_params["quantization"]}
+    if index_params["index_type"] == "hnsw":
+        wanted.update(m=index_params["hnsw_m"], ef_construction=index_params["hnsw_ef_construction"])
+    elif index_params["index_type"] == "ivf" and index_params["ivf_nlist"]:
+        wanted["nlist"] = index_params["ivf_nlist"]
+    return all(built.get(name, "none") == value for name, value in wanted.items())
+
+
+def _rewrite_shard(shard_dir: str, key: str, index_params: dict, batch_size: int) -> None:
+    """Rebuild a shard's FAISS index from its stored chunks and vectors."""
+    store = ChunkStore(shard_dir)
+    vectors = load_vectors(shard_dir, mmap=True)
+    with _writer(shard_dir, index_params) as writer:
+        for batch in _batched(range(len(store)), batch_size):
+            writer.add([store.get(i) for i in batch], vectors[batch], source=key)
+        del vectors  # close the vectors.npy map before commit replaces or removes it
+        writer.commit(embedding=embedding_settings(shard_dir))
+
+
+def _remove_stale_files(output_dir: str, old_shards: list[str], names: list[str]) -> None:
+    """Delete shards that are no longer listed and any pre-shard index files."""
+    current = {os.path.join(output_dir, shard_slug(name)) for name in names}
+    for path in old_shards:
+        if path not in current and os.path.isdir(path):
+            shutil.rmtree(path)
+            log.info("Removed stale shard %s/", path)
+    for name in (
+        INDEX_FILE, TEXT_FILE, CHUNKS_FILE, BM25_FILE, VECTORS_FILE, STORE_FILE,
+        LEGACY_DOCSTORE_FILE,
+    ):
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+            log.info("Removed unsharded %s from %s/", name, output_dir)
+
+
+# ── Main entry point ──────────────────────────────────────────────────────
+
+def _available_books(keys: list[str], books_dir: str, warn: bool = True) -> list[str]:
+    """The book ``keys`` that are known and have their PDF in ``books_dir``."""
+    available = []
+    for key in keys:
+        if key not in BOOK_INDEXERS:
+            if warn:
+                log.warning("Unknown book key: %s (skipping)", key)
+            continue
+        pdf_path = os.path.join(books_dir, BOOK_FILES[key])
+        if not os.path.exists(pdf_path):
+            if warn:
+                log.warning("PDF not found: %s (skipping)", pdf_path)
+            continue
+        available.append(key)
+    return available
+
+
 def build_index(
     books: Optional[list[str]] = None,
     books_dir: str = "books",
     output_dir: Optional[str] = None,
+    index_type: str = INDEX_TYPE,
+    quantization: str = QUANTIZATION,
+    hnsw_m: int = HNSW_M,
+    hnsw_ef_construction: int = HNSW_EF_CONSTRUCTION,
+    ivf_nlist: int = IVF_NLIST,
+    jobs: int = INDEX_JOBS,
+    batch_size: int = EMBED_BATCH_SIZE,
+    multi_process: bool = EMBED_MULTI_PROCESS,
+    normalize: bool = EMBED_NORMALIZE,
+    incremental: bool = False,
+    embed_cache_path: Optional[str] = EMBED_CACHE_PATH,
+    pipeline_batch_size: int = PIPELINE_BATCH_SIZE,
+    dedup: bool = DEDUP_ENABLED,
+    split_mode: str = SPLIT_MODE,
 ) -> None:
     """Build and save a FAISS vectorstore from one or more books.
 
+    Indexing is a streaming pipeline: PDF pages flow through the splitter
+    and chapter tagger into fixed-size batches, and each batch is embedded
+    and appended to the index before the next is read, so memory stays flat
+    whatever the corpus size. Books are parsed and chunked in parallel
+    worker processes that share the ``jobs`` budget, and embedded one after
+    another in the main process as each book's chunks become available.
+
+    Every ``book_name`` gets its own shard (a compact index in a
+    subdirectory, listed in ``shards.json``), so The Lord of the Rings PDF
+    yields one shard per volume and queries can be scoped to some books.
+
+    By default the index is rebuilt from ``books`` alone. With
+    ``incremental`` the existing index is kept: only books whose PDF hash
+    (or the chunking/embedding parameters) changed are re-embedded, and the
+    shards of untouched books are left as they are. If the existing shards
+    cannot be reused at all (parameters changed, shards missing), every
+    book with a PDF is re-embedded whatever ``books`` says, and the build
+    stops without touching the index if an indexed book has no PDF. A
+    ``manifest.json`` next to the index records what was built.
+
     Args:
         books: List of book keys to index (default: all three).
         books_dir: Directory containing the source PDFs.
         output_dir: Where to save the FAISS index (default: config value).
+        index_type: ``flat`` (exact), ``hnsw`` or ``ivf``.
+        quantization: ``none``, ``int8`` or ``binary`` vector codes.
+        hnsw_m: HNSW graph neighbours per node.
+        hnsw_ef_construction: HNSW construction search depth.
+        ivf_nlist: IVF list count (``0`` = automatic).
+        jobs: Worker processes for parsing books and extracting their PDF
+            pages, shared across books (``0`` = one per CPU).
+        batch_size: Chunks per embedding forward pass.
+        multi_process: Embed with a multi-process pool across CPU cores.
+        normalize: Store unit-length embeddings.
+        incremental: Keep unchanged books' shards instead of replacing them.
+        embed_cache_path: SQLite embedding cache (``None``/empty disables it).
+        pipeline_batch_size: Chunks embedded and written per pipeline step.
+        dedup: Strip running headers/footers and drop near-duplicate chunks.
+        split_mode: ``recursive`` (``CHUNK_SIZE`` characters per page) or
+            ``sentence`` (whole sentences, ``CHUNK_TOKENS`` per chunk, never
+            crossing a chapter).
     """
     output_dir = output_dir or FAISS_INDEX_DIR
-    books = books or list(BOOK_INDEXERS.keys())
+    requested = _available_books(books or list(BOOK_INDEXERS), books_dir)
+    params = _chunking_params(normalize, dedup, split_mode)
 
-    all_docs: list[Document] = []
-    for key in books:
-        indexer = BOOK_INDEXERS.get(key)
-        if indexer is None:
-            log.warning("Unknown book key: %s (skipping)", key)
-            continue
-        all_docs.extend(indexer(books_dir))
+    # Incremental: keep the shards of every previously indexed book whose PDF
+    # is unchanged (or not requested) and re-embed only the rest.
+    previous = _load_manifest(output_dir, params) if incremental else None
+    if incremental and previous is None and read_shards(output_dir):
+        # The existing shards cannot be reused, and replacing them with only
+        # the requested books would drop every other book from the index
+        available = _available_books(list(BOOK_INDEXERS), books_dir, warn=False)
+        indexed = (_read_manifest(output_dir) or {}).get("books", {})
+        missing = [key for key in indexed if key not in available]
+        if missing:
+            log.error(
+                "Cannot rebuild %s/: no PDF in %s/ for %s — leaving the index unchanged",
+                output_dir, books_dir, ", ".join(missing),
+            )
+            return
+        log.info("Full rebuild: re-embedding every book with a PDF in %s/", books_dir)
+        requested = available
+
+    hashes = {
+        key: _file_sha256(os.path.join(books_dir, BOOK_FILES[key])) for key in requested
+    }
+    index_params = {
+        "index_type": index_type,
+        "quantization": quantization,
+        "hnsw_m": hnsw_m,
+        "hnsw_ef_construction": hnsw_ef_construction,
+        "ivf_nlist": ivf_nlist,
+    }
+    embedding = {"model": EMBEDDING_MODEL, "normalize": normalize}
 
-    if not all_docs:
+    kept: set[str] = set()
+    if previous:
+        for key, entry in previous["books"].items():
+            if key not in requested or entry["sha256"] == hashes.get(key):
+                kept.add(key)
+    to_index = [key for key in requested if key not in kept]
+    # Kept shards written with other index settings (or before the keyword
+    # index) are rewritten from their stored vectors
+    stale = [
+        name
+        for key in sorted(kept)
+        for name in previous["books"][key]["shards"]
+        if not _shard_is_current(os.path.join(output_dir, shard_slug(name)), index_params)
+    ]
+    if previous and not to_index and not stale:
+        log.info("Index in %s/ is up to date — nothing to rebuild", output_dir)
+        return
+    if kept:
+        log.info("Reusing shards of: %s", ", ".join(sorted(kept)))
+    log.info("Indexing: %s", ", ".join(to_index) or "(none)")
+
+    old_shards = [path for name, path in read_shards(output_dir).items() if name]
+    embed_cache = EmbeddingCache(embed_cache_path, EMBEDDING_MODEL) if embed_cache_path else None
+    shard_counts: dict[str, dict[str, int]] = {}
+    # Book workers are forked before the embedding model is loaded
+    with ExitStack() as stack:
+        chunks = stack.enter_context(_book_chunks(to_index, books_dir, jobs, dedup, split_mode))
+        embed = stack.enter_context(Embedder(batch_size, multi_process, normalize, embed_cache))
+        for key in BOOK_INDEXERS:
+            if key in kept:
+                shard_counts[key] = previous["books"][key]["shards"]
+                for name in shard_counts[key]:
+                    if name in stale:
+                        log.info("Rewriting shard '%s' with the new index settings", name)
+                        _rewrite_shard(
+                            os.path.join(output_dir, shard_slug(name)), key, index_params,
+                            pipeline_batch_size,
+                        )
+            elif key in to_index:
+                shard_counts[key] = _write_shards(
+                    output_dir, key, chunks[key], embed, index_params, embedding,
+                    pipeline_batch_size,
+                )
+    if embed_cache is not None and embed_cache.hits + embed_cache.misses:
+        log.info(embed_cache.summary())
+
+    names = [name for counts in shard_counts.values() for name in counts]
+    if not names:
         log.error("No documents indexed. Check that PDFs exist in %s/", books_dir)
         return
+    write_shards(output_dir, names)
+    _remove_stale_files(output_dir, old_shards, names)
+    log.info(
+        "Total chunks: %d in %d shards",
+        sum(sum(counts.values()) for counts in shard_counts.values()),
+        len(names),
+    )
 
-    log.info("Total chunks: %d — building FAISS index...", len(all_docs))
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-    vectorstore = FAISS.from_documents(all_docs, embeddings)
-    vectorstore.save_local(output_dir)
-    log.info("Saved FAISS index to %s/", output_dir)
+    books_manifest = {
+        key: previous["books"][key] if key in kept else {
+            "pdf": BOOK_FILES[key],
+            "sha256": hashes[key],
+            "chunks": sum(counts.values()),
+            "shards": counts,
+        }
+        for key, counts in shard_counts.items()
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"params": params, "books": books_manifest}, f, indent=2)
+    log.info("Saved FAISS index to %s/ (%s, %s)", output_dir, index_type, quantization)
 
 
 if __name__ == "__main__":
@@ -279,5 +1246,113 @@ if __name__ == "__main__":
         default=None,
         help=f"Output index directory (default: {FAISS_INDEX_DIR})",
     )
+    parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default=INDEX_TYPE,
+        help=f"FAISS index type (default: {INDEX_TYPE})",
+    )
+    parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATIONS,
+        default=QUANTIZATION,
+        help=f"Vector codes, re-scored in float at query time (default: {QUANTIZATION})",
+    )
+    parser.add_argument(
+        "--hnsw-m",
+        type=int,
+        default=HNSW_M,
+        help=f"HNSW neighbours per node (default: {HNSW_M})",
+    )
+    parser.add_argument(
+        "--hnsw-ef-construction",
+        type=int,
+        default=HNSW_EF_CONSTRUCTION,
+        help=f"HNSW construction depth (default: {HNSW_EF_CONSTRUCTION})",
+    )
+    parser.add_argument(
+        "--ivf-nlist",
+        type=int,
+        default=IVF_NLIST,
+        help="IVF list count (default: 4 * sqrt(chunks))",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=INDEX_JOBS,
+        help="Worker processes for parsing books in parallel, shared with PDF page "
+        "extraction (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=EMBED_BATCH_SIZE,
+        help=f"Chunks per embedding batch (default: {EMBED_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--pipeline-batch-size",
+        type=int,
+        default=PIPELINE_BATCH_SIZE,
+        help=f"Chunks embedded and written per pipeline step (default: {PIPELINE_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--multi-process",
+        action=argparse.BooleanOptionalAction,
+        default=EMBED_MULTI_PROCESS,
+        help="Embed with a process pool across all CPU cores",
+    )
+    parser.add_argument(
+        "--normalize",
+        action=argparse.BooleanOptionalAction,
+        default=EMBED_NORMALIZE,
+        help="Store unit-length embeddings (queries are normalised to match)",
+    )
+    parser.add_argument(
+        "--split-mode",
+        choices=SPLIT_MODES,
+        default=SPLIT_MODE,
+        help=f"Chunking strategy (default: {SPLIT_MODE})",
+    )
+    parser.add_argument(
+        "--dedup",
+        action=argparse.BooleanOptionalAction,
+        default=DEDUP_ENABLED,
+        help="Strip running headers/footers and drop near-duplicate chunks",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Re-embed only changed books and keep the shards of the others",
+    )
+    parser.add_argument(
+        "--embed-cache",
+        default=EMBED_CACHE_PATH,
+        help=f"Embedding cache file (default: {EMBED_CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--no-embed-cache",
+        dest="embed_cache",
+        action="store_const",
+        const=None,
+        help="Embed every chunk without reading or writing the cache",
+    )
     args = parser.parse_args()
-    build_index(books=args.book, books_dir=args.books_dir, output_dir=args.output)
+    build_index(
+        books=args.book,
+        books_dir=args.books_dir,
+        output_dir=args.output,
+        index_type=args.index_type,
+        quantization=args.quantization,
+        hnsw_m=args.hnsw_m,
+        hnsw_ef_construction=args.hnsw_ef_construction,
+        ivf_nlist=args.ivf_nlist,
+        jobs=args.jobs,
+        batch_size=args.batch_size,
+        multi_process=args.multi_process,
+        normalize=args.normalize,
+        incremental=args.incremental,
+        embed_cache_path=args.embed_cache,
+        pipeline_batch_size=args.pipeline_batch_size,
+        dedup=args.dedup,
+        split_mode=args.split_mode,
+    )
@@ -0,0 +1,437 @@
+"""Lean query path: sentence-transformers + ``faiss.Index.search``, no LangChain.
+
+``db.as_retriever(search_kwargs={"k": 6}).invoke(question)`` goes through
+the retriever's callback manager, ``HuggingFaceEmbeddings`` (list-of-floats
+round trip), the FAISS vectorstore wrapper and a docstore id lookup per hit.
+:class:`NativeRetriever` keeps only the parts that do work: one ``encode``
+call, one ``search`` on a float32 array and one row lookup per result. On a
+single index it returns the same documents in the same order as the
+LangChain path.
+
+Sharded indexes hold one FAISS index per book. A search can be scoped to
+some books, which then search only their own vectors; unscoped searches fan
+out across every shard on a thread pool (FAISS releases the GIL) and merge
+the per-shard top-k by distance.
+
+:class:`HybridRetriever` adds a BM25 keyword search over each shard's
+``bm25.npz`` and fuses both rankings by reciprocal rank, so rare proper
+nouns the embedding model blurs ("Nirnaeth Arnoediad") still surface the
+chunks that name them.
+
+``search_with_score`` pairs each chunk with its similarity to the query,
+``1 - squared L2 distance / 2`` (the cosine similarity for unit-length
+embeddings, which all-MiniLM-L6-v2 produces), for confidence gating.
+``search_adaptive`` uses the same scores to send fewer chunks when the best
+hits stand out from the rest (see :func:`adaptive_k`). The cut is always made
+on the dense ranking the scores belong to; hybrid search then fuses the kept
+dense hits with the BM25 hits and keeps as many chunks. ``retrieve`` picks
+fixed or adaptive k the way the app is configured.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable, Hashable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from sentence_transformers import SentenceTransformer
+
+from config import (
+    ADAPTIVE_K,
+    ADAPTIVE_RELEVANCE_MASS,
+    ADAPTIVE_SCORE_GAP,
+    ADAPTIVE_TEMPERATURE,
+    BM25_B,
+    BM25_K1,
+    EMBEDDING_MODEL,
+    HYBRID_CANDIDATES,
+    HYBRID_SEARCH,
+    RETRIEVAL_K,
+    RETRIEVAL_MAX_K,
+    RETRIEVAL_MIN_K,
+    RRF_K,
+    SHARD_WORKERS,
+)
+from index_store import (
+    BM25Index,
+    RescoringIndex,
+    embedding_settings,
+    load_bm25,
+    open_index,
+    read_shards,
+)
+
+log = logging.getLogger(__name__)
+
+Hit = tuple[int, int]  # (shard position, row within the shard)
+
+
+def similarity(distance: float) -> float:
+    """Query-chunk similarity from a squared L2 distance (cosine for unit vectors)."""
+    return 1.0 - distance / 2.0
+
+
+def confidence(results: Sequence[tuple[Document, Optional[float]]]) -> float:
+    """Best dense similarity among ``search_with_score`` results (-inf if none)."""
+    return max((score for _, score in results if score is not None), default=-np.inf)
+
+
+def adaptive_k(
+    scores: Sequence[float],
+    min_k: int = RETRIEVAL_MIN_K,
+    max_k: int = RETRIEVAL_MAX_K,
+    gap: float = ADAPTIVE_SCORE_GAP,
+    mass: float = ADAPTIVE_RELEVANCE_MASS,
+    temperature: float = ADAPTIVE_TEMPERATURE,
+) -> int:
+    """How many chunks of a dense ranking are worth sending to the LLM.
+
+    ``scores`` are the similarities of a best-first dense ranking. They are
+    cut before the first drop of at least ``gap``, or once the kept chunks
+    hold ``mass`` of the pool's relevance (``softmax(similarity /
+    temperature)``), whichever comes first. One clear match thus keeps
+    ``min_k`` chunks; evenly matched candidates keep up to ``max_k``.
+    """
+    ordered = np.asarray(scores, dtype=np.float64)[:max_k]
+    k = len(ordered)
+    if k:
+        drops = np.flatnonzero(ordered[:-1] - ordered[1:] >= gap)
+        if len(drops):
+            k = int(drops[0]) + 1
+        weights = np.exp((ordered - ordered[0]) / temperature)
+        share = np.cumsum(weights) / weights.sum()
+        k = min(k, int(np.searchsorted(share, mass)) + 1)
+    return max(min_k, min(k, max_k))
+
+
+@dataclass
+class Shard:
+    """One searchable index: FAISS rows, their chunks and BM25 postings."""
+
+    name: str  # book_name of every chunk ("" for an unsharded index)
+    index: Union[faiss.Index, RescoringIndex]
+    lookup: Callable[[int], Document]
+    lexical: Optional[BM25Index] = None
+
+
+class NativeRetriever:
+    """Embed a question and fetch its nearest chunks straight from FAISS.
+
+    Args:
+        model: Sentence-transformers model the index was built with.
+        shards: Indexes to search, in corpus order.
+        normalize: Unit-normalise query embeddings, as the index build did.
+        k: Default number of chunks returned by :meth:`invoke`.
+        workers: Threads searching shards in parallel.
+    """
+
+    def __init__(
+        self,
+        model: SentenceTransformer,
+        shards: Sequence[Shard],
+        normalize: bool = False,
+        k: int = RETRIEVAL_K,
+        workers: int = SHARD_WORKERS,
+    ) -> None:
+        self.model = model
+        self.shards = list(shards)
+        self.normalize = normalize
+        self.k = k
+        workers = min(workers, len(self.shards))
+        self._pool = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard")
+            if workers > 1
+            else None
+        )
+
+    @property
+    def books(self) -> list[str]:
+        """Names of the books that can be searched on their own."""
+        return [shard.name for shard in self.shards if shard.name]
+
+    def embed_query(self, question: str) -> np.ndarray:
+        """Embed ``question`` exactly as ``HuggingFaceEmbeddings.embed_query`` does."""
+        # HuggingFaceEmbeddings replaces newlines before encoding
+        return self.model.encode(
+            [question.replace("\n", " ")],
+            normalize_embeddings=self.normalize,
+            convert_to_numpy=True,
+        )[0].astype(np.float32, copy=False)
+
+    def _select(self, books: Optional[Sequence[str]]) -> list[int]:
+        """Positions of the shards to search (all of them when ``books`` is empty)."""
+        if not books:
+            return list(range(len(self.shards)))
+        unknown = set(books) - set(self.books)
+        if unknown:
+            raise ValueError(f"Unknown book(s): {', '.join(sorted(unknown))}")
+        return [i for i, shard in enumerate(self.shards) if shard.name in books]
+
+    def _map(self, search: Callable[[int], tuple], positions: list[int]) -> list[tuple]:
+        """Run ``search`` per shard position, in parallel when there are several."""
+        if self._pool is None or len(positions) < 2:
+            return [search(i) for i in positions]
+        return list(self._pool.map(search, positions))
+
+    @staticmethod
+    def _merge(
+        positions: list[int], results: list[tuple], k: int, descending: bool = False
+    ) -> tuple[list[Hit], list[float]]:
+        """Top ``k`` hits and their scores over per-shard ``(scores, rows)``.
+
+        Ties keep shard order.
+        """
+        hits = [
+            (float(score), i, int(row))
+            for i, (scores, rows) in zip(positions, results)
+            for score, row in zip(scores, rows)
+        ]
+        hits.sort(key=lambda hit: -hit[0] if descending else hit[0])
+        return [(i, row) for _, i, row in hits[:k]], [score for score, _, _ in hits[:k]]
+
+    def _dense(
+        self, embedding: np.ndarray, k: int, positions: list[int]
+    ) -> tuple[list[Hit], list[float]]:
+        """The ``k`` nearest chunks across the given shards and their distances."""
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+
+        def search(i: int) -> tuple[np.ndarray, np.ndarray]:
+            distances, ids = self.shards[i].index.search(query, k)
+            found = ids[0] != -1
+            return distances[0][found], ids[0][found]
+
+        return self._merge(positions, self._map(search, positions), k)
+
+    def _documents(self, hits: Sequence[Hit]) -> list[Document]:
+        return [self.shards[i].lookup(row) for i, row in hits]
+
+    def search(
+        self,
+        embedding: np.ndarray,
+        k: Optional[int] = None,
+        question: Optional[str] = None,
+        books: Optional[Sequence[str]] = None,
+    ) -> list[Document]:
+        """Return the ``k`` chunks nearest to ``embedding``, closest first.
+
+        Args:
+            embedding: Query embedding from :meth:`embed_query`.
+            k: Chunks to return (default: ``self.k``).
+            question: Ignored here; :class:`HybridRetriever` matches its keywords.
+            books: Only search these books (default: all).
+        """
+        return [doc for doc, _ in self.search_with_score(embedding, k, question, books)]
+
+    def search_with_score(
+        self,
+        embedding: np.ndarray,
+        k: Optional[int] = None,
+        question: Optional[str] = None,
+        books: Optional[Sequence[str]] = None,
+    ) -> list[tuple[Document, Optional[float]]]:
+        """Like :meth:`search`, pairing each chunk with its :func:`similarity`."""
+        hits, distances = self._dense(embedding, k or self.k, self._select(books))
+        return list(zip(self._documents(hits), map(similarity, distances)))
+
+    def search_adaptive(
+        self,
+        embedding: np.ndarray,
+        question: Optional[str] = None,
+        books: Optional[Sequence[str]] = None,
+        min_k: int = RETRIEVAL_MIN_K,
+        max_k: int = RETRIEVAL_MAX_K,
+    ) -> list[tuple[Document, Optional[float]]]:
+        """Like :meth:`search_with_score`, keeping :func:`adaptive_k` of ``max_k`` hits."""
+        _check_k_range(min_k, max_k)
+        results = self.search_with_score(embedding, max_k, books=books)
+        return results[: adaptive_k([score for _, score in results], min_k, max_k)]
+
+    def retrieve(
+        self,
+        embedding: np.ndarray,
+        question: Optional[str] = None,
+        books: Optional[Sequence[str]] = None,
+        adaptive: bool = ADAPTIVE_K,
+    ) -> list[tuple[Document, Optional[float]]]:
+        """Chunks and scores as the app asks for them.
+
+        :meth:`search_adaptive` with ``adaptive``, else ``self.k`` chunks.
+        """
+        if adaptive:
+            return self.search_adaptive(embedding, question, books)
+        return self.search_with_score(embedding, self.k, question, books)
+
+    def invoke(
+        self,
+        question: str,
+        k: Optional[int] = None,
+        books: Optional[Sequence[str]] = None,
+    ) -> list[Document]:
+        """Embed ``question`` and return its most relevant chunks."""
+        return self.search(self.embed_query(question), k, question, books)
+
+
+def _check_k_range(min_k: int, max_k: int) -> None:
+    if not 1 <= min_k <= max_k:
+        raise ValueError(f"Need 1 <= min_k <= max_k, got {min_k} and {max_k}")
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]], k: int, rrf_k: int = RRF_K
+) -> list[Hashable]:
+    """Merge best-first rankings by ``sum(1 / (rrf_k + rank))``.
+
+    Ties keep the order in which items were first seen, so the first ranking
+    wins them.
+    """
+    scores: dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1 / (rrf_k + rank)
+    return sorted(scores, key=scores.__getitem__, reverse=True)[:k]
+
+
+class HybridRetriever(NativeRetriever):
+    """Dense and BM25 retrieval fused by reciprocal rank.
+
+    BM25 scores are merged across shards as they are, although each shard
+    weighs terms by its own document frequencies.
+
+    Args:
+        model: Sentence-transformers model the index was built with.
+        shards: Indexes to search, each with a keyword index.
+        normalize: Unit-normalise query embeddings, as the index build did.
+        k: Default number of chunks returned by :meth:`invoke`.
+        workers: Threads searching shards in parallel.
+        candidates: Hits taken from each retriever before fusion.
+        rrf_k: Reciprocal rank fusion damping constant.
+    """
+
+    def __init__(
+        self,
+        model: SentenceTransformer,
+        shards: Sequence[Shard],
+        normalize: bool = False,
+        k: int = RETRIEVAL_K,
+        workers: int = SHARD_WORKERS,
+        candidates: int = HYBRID_CANDIDATES,
+        rrf_k: int = RRF_K,
+    ) -> None:
+        super().__init__(model, shards, normalize=normalize, k=k, workers=workers)
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+    def _lexical(self, question: str, k: int, positions: list[int]) -> list[Hit]:
+        """The ``k`` best BM25 matches across the given shards, best first."""
+        results = self._map(lambda i: self.shards[i].lexical.search(question, k), positions)
+        return self._merge(positions, results, k, descending=True)[0]
+
+    def search_with_score(
+        self,
+        embedding: np.ndarray,
+        k: Optional[int] = None,
+        question: Optional[str] = None,
+        books: Optional[Sequence[str]] = None,
+    ) -> list[tuple[Document, Optional[float]]]:
+        """Fuse the dense hits for ``embedding`` with BM25 hits for ``question``.
+
+        Chunks only BM25 found score ``None``. Without a ``question`` this is
+        plain dense search.
+        """
+        k = k or self.k
+        if not question:
+            return super().search_with_score(embedding, k, books=books)
+        positions = self._select(books)
+        n = max(k, self.candidates)
+        dense, distances = self._dense(embedding, n, positions)
+        return self._fuse(dense, distances, question, k, n, positions)
+
+    def search_adaptive(
+        self,
+        embedding: np.ndarray,
+        question: Optional[str] = None,
+        books: Optional[Sequence[str]] = None,
+        min_k: int = RETRIEVAL_MIN_K,
+        max_k: int = RETRIEVAL_MAX_K,
+    ) -> list[tuple[Document, Optional[float]]]:
+        """Cut the dense ranking at :func:`adaptive_k`, then fuse it with BM25.
+
+        The cut is made on the dense hits the scores belong to, not on the
+        fused order; the fused list keeps as many chunks as survived the cut,
+        so BM25 can still promote a keyword match into them.
+        """
+        if not question:
+            return super().search_adaptive(embedding, books=books, min_k=min_k, max_k=max_k)
+        _check_k_range(min_k, max_k)
+        positions = self._select(books)
+        n = max(max_k, self.candidates)
+        dense, distances = self._dense(embedding, n, positions)
+        k = adaptive_k([similarity(distance) for distance in distances], min_k, max_k)
+        return self._fuse(dense[:k], distances[:k], question, k, n, positions)
+
+    def _fuse(
+        self,
+        dense: list[Hit],
+        distances: list[float],
+        question: str,
+        k: int,
+        depth: int,
+        positions: list[int],
+    ) -> list[tuple[Document, Optional[float]]]:
+        """Top ``k`` of ``dense`` fused with ``depth`` BM25 hits, with dense scores."""
+        hits = reciprocal_rank_fusion(
+            [dense, self._lexical(question, depth, positions)], k, self.rrf_k
+        )
+        scores = {hit: similarity(distance) for hit, distance in zip(dense, distances)}
+        return list(zip(self._documents(hits), map(scores.get, hits)))
+
+
+def load_retriever(
+    index_dir: str,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    rerank_factor: int = 4,
+    model: Optional[SentenceTransformer] = None,
+    hybrid: bool = HYBRID_SEARCH,
+) -> NativeRetriever:
+    """Open ``index_dir`` with the embedding settings it was built with.
+
+    Returns a :class:`HybridRetriever` when ``hybrid`` is set and every shard
+    has a keyword index, otherwise a dense-only :class:`NativeRetriever`.
+
+    Args:
+        index_dir: Sharded, compact or legacy LangChain index directory.
+        ef_search: HNSW query depth (ignored for other index types).
+        nprobe: IVF lists scanned per query (ignored for other index types).
+        rerank_factor: Candidate pool of quantized indexes.
+        model: Already-loaded embedding model (loaded from config if omitted).
+        hybrid: Fuse BM25 keyword hits with the dense hits.
+    """
+    shard_dirs = read_shards(index_dir)
+    if not shard_dirs:
+        raise FileNotFoundError(f"No index found in {index_dir}/")
+    settings = embedding_settings(index_dir)
+    if settings["model"] and settings["model"] != EMBEDDING_MODEL:
+        log.warning(
+            "Index was built with %s but EMBEDDING_MODEL is %s",
+            settings["model"],
+            EMBEDDING_MODEL,
+        )
+    if model is None:
+        model = SentenceTransformer(EMBEDDING_MODEL)
+
+    shards = []
+    for name, shard_dir in shard_dirs.items():
+        index, lookup = open_index(shard_dir, ef_search, nprobe, rerank_factor)
+        lexical = load_bm25(shard_dir, k1=BM25_K1, b=BM25_B) if hybrid else None
+        shards.append(Shard(name, index, lookup, lexical))
+    if hybrid:
+        if all(shard.lexical is not None for shard in shards):
+            return HybridRetriever(model, shards, normalize=settings["normalize"])
+        log.warning("No keyword index in %s/ — rebuild it for hybrid search", index_dir)
+    return NativeRetriever(model, shards, normalize=settings["normalize"])
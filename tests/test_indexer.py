@@ -0,0 +1,199 @@
+"""Tests for the indexing pipeline (no PDFs or embedding model needed)."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import indexer
+from index_store import read_shards
+
+BOOKS = {
+    "hobbit": ("the_hobbit.pdf", "The Hobbit"),
+    "lotr": ("lotr.pdf", "The Fellowship of the Ring"),
+    "silmarillion": ("silmarillion.pdf", "The Silmarillion"),
+}
+
+
+class FakeEmbedder:
+    """Deterministic stand-in for :class:`indexer.Embedder`."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def __enter__(self) -> "FakeEmbedder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        return np.stack([
+            np.frombuffer(hashlib.sha256(text.encode()).digest(), dtype=np.uint8)[:8] / 255
+            for text in texts
+        ]).astype(np.float32)
+
+
+def _fake_indexer(book_name: str):
+    def index(books_dir, extract_jobs, dedup, split_mode):
+        for i in range(5):
+            yield Document(
+                page_content=f"{book_name} passage {i}",
+                metadata={"book_name": book_name, "chapter_name": "Unknown"},
+            )
+
+    return index
+
+
+@pytest.fixture
+def books_dir(tmp_path, monkeypatch):
+    """Three dummy PDFs with fake chunkers and embedder patched in."""
+    monkeypatch.setattr(indexer, "BOOK_FILES", {key: pdf for key, (pdf, _) in BOOKS.items()})
+    monkeypatch.setattr(
+        indexer, "BOOK_INDEXERS", {key: _fake_indexer(name) for key, (_, name) in BOOKS.items()}
+    )
+    monkeypatch.setattr(indexer, "Embedder", FakeEmbedder)
+    path = tmp_path / "books"
+    path.mkdir()
+    for key, (pdf, _) in BOOKS.items():
+        (path / pdf).write_bytes(key.encode())
+    return path
+
+
+def _build(books_dir, output_dir, **kwargs) -> None:
+    indexer.build_index(
+        books_dir=str(books_dir), output_dir=str(output_dir), embed_cache_path="", **kwargs
+    )
+
+
+def test_incremental_with_changed_params_rebuilds_every_book(books_dir, tmp_path):
+    output_dir = tmp_path / "index"
+    _build(books_dir, output_dir)
+    assert len(read_shards(str(output_dir))) == 3
+
+    _build(books_dir, output_dir, books=["hobbit"], incremental=True, normalize=True)
+
+    assert list(read_shards(str(output_dir))) == [name for _, name in BOOKS.values()]
+    manifest = json.loads((output_dir / "manifest.json").read_text())
+    assert set(manifest["books"]) == set(BOOKS)
+    assert manifest["params"]["normalize"] is True
+
+
+def test_incremental_rebuild_without_every_pdf_keeps_the_index(books_dir, tmp_path):
+    output_dir = tmp_path / "index"
+    _build(books_dir, output_dir)
+    before = {
+        name: sorted(os.listdir(path)) for name, path in read_shards(str(output_dir)).items()
+    }
+    os.remove(books_dir / BOOKS["silmarillion"][0])
+
+    _build(books_dir, output_dir, books=["hobbit"], incremental=True, normalize=True)
+
+    after = {
+        name: sorted(os.listdir(path)) for name, path in read_shards(str(output_dir)).items()
+    }
+    assert after == before
+    manifest = json.loads((output_dir / "manifest.json").read_text())
+    assert manifest["params"]["normalize"] is False
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="book workers must inherit the patched indexers",
+)
+def test_parallel_books_build_the_same_index(books_dir, tmp_path):
+    _build(books_dir, tmp_path / "serial", jobs=1)
+    _build(books_dir, tmp_path / "parallel", jobs=3)
+
+    serial = read_shards(str(tmp_path / "serial"))
+    parallel = read_shards(str(tmp_path / "parallel"))
+    assert list(parallel) == list(serial)
+    for name, path in serial.items():
+        for file in ("text.bin", "chunks.npy"):
+            with open(os.path.join(path, file), "rb") as f:
+                expected = f.read()
+            with open(os.path.join(parallel[name], file), "rb") as f:
+                assert f.read() == expected
+
+
+def _word_count(texts: list[str]) -> list[int]:
+    return [len(text.split()) for text in texts]
+
+
+def test_sentence_chunker_separates_words_across_a_page_break():
+    chunker = indexer.SentenceChunker(_word_count, max_tokens=50, overlap_tokens=0)
+    chapter = {"book_name": "The Hobbit", "chapter_name": "An Unexpected Party"}
+    chunks = list(chunker.feed("Bilbo sat down, for he was tired", chapter))
+    chunks += chunker.feed("because the road was long. Then he slept.", chapter)
+    chunks += chunker.flush()
+
+    assert [text for text, _ in chunks] == [
+        "Bilbo sat down, for he was tired because the road was long. Then he slept."
+    ]
+
+
+@pytest.mark.parametrize("cache", [True, False])
+def test_dedup_extracts_the_pdf_once(tmp_path, monkeypatch, cache):
+    pages = [
+        f"THE HOBBIT\n\n{words}\n\n{i}\n"
+        for i, words in enumerate(["Bilbo", "Gandalf", "Thorin", "Smaug", "Beorn", "Bard"])
+    ]
+    extractions = []
+
+    def extract(pdf_path, jobs):
+        extractions.append(pdf_path)
+        yield from pages
+
+    monkeypatch.setattr(indexer, "_extract_pages", extract)
+    monkeypatch.setattr(indexer, "PAGE_CACHE_DIR", str(tmp_path / "pages") if cache else "")
+    pdf = tmp_path / "the_hobbit.pdf"
+    pdf.write_bytes(b"%PDF")
+
+    docs = list(
+        indexer._tag_chunks(
+            str(pdf), 1, lambda lines, i, current: None, {"book_name": "The Hobbit"},
+            dedup=True, split_mode="recursive",
+        )
+    )
+
+    assert extractions == [str(pdf)]
+    assert [doc.page_content for doc in docs] == [
+        "Bilbo", "Gandalf", "Thorin", "Smaug", "Beorn", "Bard"
+    ]
+
+
+def test_interrupted_extraction_leaves_no_partial_page_cache(tmp_path, monkeypatch):
+    def extract(pdf_path, jobs):
+        yield "Chapter I"
+        raise RuntimeError("corrupt page")
+
+    monkeypatch.setattr(indexer, "_extract_pages", extract)
+    pdf = tmp_path / "the_hobbit.pdf"
+    pdf.write_bytes(b"%PDF")
+    cache_dir = tmp_path / "pages"
+
+    with pytest.raises(RuntimeError):
+        list(indexer._load_pages(str(pdf), 1, str(cache_dir)))
+    pages = indexer._load_pages(str(pdf), 1, str(cache_dir))
+    next(pages)
+    pages.close()
+
+    assert os.listdir(cache_dir) == []
+
+
+def test_incremental_after_a_pypdf_upgrade_rebuilds_every_book(books_dir, tmp_path, monkeypatch):
+    output_dir = tmp_path / "index"
+    _build(books_dir, output_dir)
+    monkeypatch.setattr(indexer, "_extractor_version", lambda: "pypdf-99.0-v1")
+
+    _build(books_dir, output_dir, books=["hobbit"], incremental=True)
+
+    manifest = json.loads((output_dir / "manifest.json").read_text())
+    assert manifest["params"]["extractor"] == "pypdf-99.0-v1"
+    assert set(manifest["books"]) == set(BOOKS)
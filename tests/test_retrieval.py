@@ -0,0 +1,69 @@
+"""Tests for score-driven retrieval (synthetic vectors, no embedding model)."""
+
+from __future__ import annotations
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from retrieval import HybridRetriever, NativeRetriever, Shard, adaptive_k
+
+
+def test_adaptive_k_keeps_min_k_for_one_clear_match():
+    assert adaptive_k([0.72, 0.48, 0.47, 0.46, 0.45, 0.44], min_k=2, max_k=10) == 2
+
+
+def test_adaptive_k_cuts_at_the_first_score_gap():
+    scores = [0.62, 0.60, 0.58, 0.45, 0.44, 0.43, 0.40, 0.39, 0.38, 0.37]
+    assert adaptive_k(scores, min_k=2, max_k=10) == 3
+
+
+def test_adaptive_k_keeps_evenly_matched_chunks_up_to_max_k():
+    scores = [0.55, 0.54, 0.54, 0.53, 0.53, 0.52, 0.52, 0.51, 0.51, 0.50]
+    assert adaptive_k(scores, min_k=2, max_k=10, mass=1.0) == 10
+    assert adaptive_k(scores, min_k=2, max_k=4, mass=1.0) == 4
+
+
+class FakeLexical:
+    """BM25 stand-in returning fixed rows, best first."""
+
+    def __init__(self, rows: list[int]) -> None:
+        self.rows = rows
+
+    def search(self, question: str, k: int) -> tuple[np.ndarray, np.ndarray]:
+        rows = np.array(self.rows[:k])
+        return np.arange(len(rows), 0, -1, dtype=np.float32), rows
+
+
+def _shard(lexical_rows: list[int]) -> tuple[Shard, np.ndarray]:
+    """Unit vectors whose similarity to the query falls 0.9, 0.89, 0.88, then 0.4, ..."""
+    similarities = np.array([0.9, 0.89, 0.88, 0.4, 0.38, 0.36, 0.34, 0.32])
+    n = len(similarities)
+    query = np.zeros(n + 1, dtype=np.float32)
+    query[0] = 1.0
+    vectors = np.zeros((n, n + 1), dtype=np.float32)
+    vectors[:, 0] = similarities
+    vectors[np.arange(n), np.arange(1, n + 1)] = np.sqrt(1 - similarities**2)
+    index = faiss.IndexFlatL2(n + 1)
+    index.add(vectors)
+    docs = [Document(id=str(i), page_content=f"chunk {i}") for i in range(len(vectors))]
+    return Shard("", index, docs.__getitem__, FakeLexical(lexical_rows)), query
+
+
+def test_search_adaptive_cuts_the_dense_ranking_it_scored():
+    shard, query = _shard([])
+    results = NativeRetriever(None, [shard]).search_adaptive(query, min_k=1, max_k=8)
+    assert [doc.id for doc, _ in results] == ["0", "1", "2"]
+    assert np.allclose([score for _, score in results], [0.9, 0.89, 0.88], atol=1e-5)
+
+
+def test_hybrid_search_adaptive_fuses_only_the_kept_dense_hits():
+    # BM25 favours chunk 7, a dense hit below the score gap
+    shard, query = _shard([7, 5])
+    retriever = HybridRetriever(None, [shard], candidates=8)
+    results = retriever.search_adaptive(query, "question", min_k=1, max_k=8)
+
+    # dense keeps 0, 1, 2; fusion with BM25 [7, 5] keeps as many chunks
+    assert [doc.id for doc, _ in results] == ["0", "7", "1"]
+    # chunk 7 was cut from the dense ranking, so it carries no dense score
+    assert results[1][1] is None